@@ -20,6 +20,7 @@ from utils import handle_question
 from dashboard_queries import get_kpi_stats, get_visit_trend, get_top_visitors
 from reports import generate_and_email_report
 from config import PLOT_DIR, SECRET_KEY
+from database import PoolExhaustedError
 # Import manager AFTER app and socketio are created or use a function.
 
 # --- Basic Logging Setup ---
@@ -41,11 +42,13 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})  # Be more specific for produ
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
 cache = Cache(app)
 
-# --- Set SocketIO instance for Manager ---
-# Import manager *after* socketio is defined
-from recognition_manager import recognition_manager_instance, set_socketio_instance
+# --- Recognition Manager ---
+# Recognition runs in a separate native process so dlib never blocks the
+# eventlet hub; blocking pipe reads are pushed to real OS threads via tpool.
+from eventlet import tpool
+from recognition_worker import RecognitionProcess
 
-set_socketio_instance(socketio)
+recognition_manager_instance = RecognitionProcess(socketio, offload=tpool.execute)
 
 # --- API Endpoints ---
 
@@ -56,7 +59,7 @@ def start_rec():
     data = request.get_json() or {}
     logger.info(f"Received start recognition request: {data}")
     result = recognition_manager_instance.start(
-        data.get("start_time"), data.get("end_time")
+        data.get("start_time"), data.get("end_time"), data.get("camera_id")
     )
     return jsonify(result)
 
@@ -64,8 +67,9 @@ def start_rec():
 @app.route("/api/recognition/stop", methods=["POST"])
 @api_key_required
 def stop_rec():
-    logger.info("Received stop recognition request.")
-    result = recognition_manager_instance.stop()
+    data = request.get_json(silent=True) or {}
+    logger.info(f"Received stop recognition request: {data}")
+    result = recognition_manager_instance.stop(data.get("camera_id"))
     return jsonify(result)
 
 
@@ -76,6 +80,41 @@ def status_rec():
     return jsonify(result)
 
 
+@app.route("/api/recognition/cameras", methods=["GET"])
+@api_key_required
+def list_cameras():
+    status = recognition_manager_instance.get_status()
+    return jsonify(list(status["cameras"].values()))
+
+
+@app.route("/api/recognition/cameras/<camera_id>/start", methods=["POST"])
+@api_key_required
+def start_camera(camera_id):
+    data = request.get_json(silent=True) or {}
+    logger.info(f"Received start request for camera {camera_id}: {data}")
+    result = recognition_manager_instance.start(
+        data.get("start_time"), data.get("end_time"), camera_id
+    )
+    return jsonify(result)
+
+
+@app.route("/api/recognition/cameras/<camera_id>/stop", methods=["POST"])
+@api_key_required
+def stop_camera(camera_id):
+    logger.info(f"Received stop request for camera {camera_id}.")
+    result = recognition_manager_instance.stop(camera_id)
+    return jsonify(result)
+
+
+@app.route("/api/recognition/cameras/<camera_id>/status", methods=["GET"])
+@api_key_required
+def status_camera(camera_id):
+    result = recognition_manager_instance.get_status(camera_id)
+    if result is None:
+        return jsonify({"error": f"Unknown camera: {camera_id}"}), 404
+    return jsonify(result)
+
+
 @app.route("/api/chat", methods=["POST"])
 @api_key_required
 def chat():
@@ -146,13 +185,22 @@ def generate_report_api():
     return jsonify(result)
 
 
+@app.errorhandler(PoolExhaustedError)
+def handle_pool_exhausted(e):
+    # Busy, not broken: tell the client to retry instead of showing zeros.
+    return jsonify({"status": "error", "message": "Database busy, try again."}), 503
+
+
 # --- SocketIO Events ---
 @socketio.on("connect")
 def handle_connect():
     logger.info(f"Client connected: {request.sid}")
-    # Send initial status on connect
+    # Send initial status on connect. Connecting must not launch the worker
+    # (up to START_TIMEOUT); until an API call starts it, it is not running.
     socketio.emit(
-        "rec_status_update", recognition_manager_instance.get_status(), room=request.sid
+        "rec_status_update",
+        recognition_manager_instance.get_status(launch=False),
+        room=request.sid,
     )
 
 
@@ -200,4 +248,7 @@ if __name__ == "__main__":
     os.makedirs(PLOT_DIR, exist_ok=True)
     os.makedirs(REPORT_DIR, exist_ok=True)
     # Run with eventlet
-    socketio.run(app, host="0.0.0.0", port=5000, debug=False, use_reloader=False)
+    try:
+        socketio.run(app, host="0.0.0.0", port=5000, debug=False, use_reloader=False)
+    finally:
+        recognition_manager_instance.close()
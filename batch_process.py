@@ -0,0 +1,385 @@
+"""Offline recognition over recorded video files.
+
+Runs the FaceProcessor pipeline over one or more video files as fast as the
+machine allows (not at playback speed), e.g. to backfill visits from recorded
+footage or to reproduce production issues:
+
+    python batch_process.py footage/*.mp4 --interval 0.5 --workers 8 --dry-run
+
+Each file is split into frame ranges that a pool of worker processes decodes,
+detects and encodes in parallel. Matching and persistence then run in this
+process, in footage order, so new customers are enrolled once no matter which
+worker saw them. Files are treated as consecutive recordings: the one-hour
+"already seen" window and the pending-enrollment timing are measured in
+footage time, not wall-clock time.
+
+Visits and enrollments are written with the time they were filmed, so a
+backfill needs to know when the footage starts: `--start-time` for the
+first file (the others follow on), or `--start-from-mtime` to end each file
+at its modification time. Without either, only `--dry-run` is allowed.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+from cachetools import TTLCache
+from storage import get_store
+from encoders import InlineEncoder
+from main import FaceProcessor
+from quality import FaceQualityGate
+from enrollment import PendingEnrollmentBuffer
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("decode", "convert", "detect", "quality", "encode", "match", "persist")
+
+
+class DryRunStore:
+    """Reads the known customers from MySQL but keeps every write in memory."""
+
+    def __init__(self):
+        self.inserted = []
+        self.visits = Counter()
+
+    def fetch_all_customers_for_rec(self):
+        try:
+            customers = get_store().fetch_all_customers_for_rec() or []
+        except Exception as e:
+            logger.warning(f"Could not load customers, starting empty: {e}")
+            customers = []
+        return list(customers) + self.inserted
+
+    def insert_customer(
+        self,
+        unique_id,
+        name,
+        email,
+        face_encoding,
+        last_visited,
+        visit_count,
+        camera_id=None,
+    ):
+        self.inserted.append(
+            {
+                "unique_id": unique_id,
+                "name": name,
+                "email": email,
+                "face_encoding": face_encoding,
+            }
+        )
+        return len(self.inserted)  # Stands in for the row id
+
+    def update_customer_visit(
+        self, unique_id, camera_id=None, distance=None, visited_at=None
+    ):
+        self.visits[unique_id] += 1
+
+
+# --- Worker side ---
+_encoder = None
+
+
+def _init_worker():
+    global _encoder
+    _encoder = InlineEncoder()
+
+
+def _video_info(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    info = {
+        "frames": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS) or 25.0,
+    }
+    cap.release()
+    return info
+
+
+def scan_segment(path, start_frame, end_frame, step, fps):
+    """Detects and encodes every `step`-th frame in [start_frame, end_frame).
+
+    Returns the encodings per sampled frame (no pixel data) plus the time
+    spent in each stage.
+    """
+    timings = dict.fromkeys(("decode", "convert", "detect", "quality", "encode"), 0.0)
+    frames = []
+    quality_gate = FaceQualityGate.from_config()
+    cap = cv2.VideoCapture(path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    frame_no = start_frame
+    while frame_no < end_frame:
+        started = time.perf_counter()
+        ret, frame = cap.read()
+        # Skip to the next sample without converting the frames in between.
+        for _ in range(step - 1):
+            if not cap.grab():
+                break
+        timings["decode"] += time.perf_counter() - started
+        if not ret:
+            break
+
+        started = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        timings["convert"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        face_locations = _encoder.detect(rgb_frame)
+        timings["detect"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        face_locations = quality_gate.filter(rgb_frame, face_locations)
+        timings["quality"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        encodings = _encoder.encode(rgb_frame, face_locations)
+        timings["encode"] += time.perf_counter() - started
+
+        frames.append((frame_no / fps, encodings))
+        frame_no += step
+
+    cap.release()
+    rejected = quality_gate.get_stats()["rejected"]
+    return {"frames": frames, "timings": timings, "rejected": rejected}
+
+
+def _scan_task(task):
+    return scan_segment(*task)
+
+
+# --- Driver ---
+def plan_tasks(paths, interval, segments_per_file):
+    """Splits each file into up to `segments_per_file` frame ranges."""
+    tasks = []
+    for path in paths:
+        info = _video_info(path)
+        if not info or info["frames"] <= 0:
+            logger.error(f"Skipping unreadable video: {path}")
+            continue
+        step = max(1, round(interval * info["fps"]))
+        samples = (info["frames"] + step - 1) // step
+        segments = max(1, min(segments_per_file, samples))
+        # Segment boundaries fall on sampled frames so no sample is lost.
+        per_segment = (samples + segments - 1) // segments * step
+        for start in range(0, info["frames"], per_segment):
+            end = min(start + per_segment, info["frames"])
+            tasks.append((path, start, end, step, info["fps"]))
+    return tasks
+
+
+def file_start_times(paths):
+    """Each file's start time, taken as its modification time minus its length."""
+    starts = {}
+    for path in paths:
+        info = _video_info(path)
+        if info:
+            length = datetime.timedelta(seconds=info["frames"] / info["fps"])
+            mtime = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+            starts[path] = mtime - length
+    return starts
+
+
+def footage_offsets(paths, starts=None):
+    """Where each file begins on the footage clock, in seconds.
+
+    A file starts where the previous one ends (its frame count / fps). With
+    `starts` (file_start_times()), a gap between two recordings is kept as
+    well, but the clock never runs backwards.
+    """
+    offsets = {}
+    end, first = 0.0, None
+    for path in paths:
+        info = _video_info(path)
+        if not info or info["frames"] <= 0:
+            continue
+        base = end
+        if starts and path in starts:
+            first = first or starts[path]
+            base = max(end, (starts[path] - first).total_seconds())
+        offsets[path] = base
+        end = base + info["frames"] / info["fps"]
+    return offsets
+
+
+def run(
+    paths,
+    interval=1.0,
+    workers=1,
+    dry_run=False,
+    start_time=None,
+    start_from_mtime=False,
+):
+    """Processes `paths` and returns the throughput report as a dict.
+
+    Sightings are stored at `start_time` plus their footage time or, with
+    `start_from_mtime`, at their time within a file that ended at the file's
+    modification time. One of the two is required unless `dry_run`.
+    """
+    if not dry_run and start_time is None and not start_from_mtime:
+        raise ValueError(
+            "A start time (or start_from_mtime) is needed to write visits."
+        )
+    paths = list(dict.fromkeys(paths))
+    mtime_starts = file_start_times(paths) if start_from_mtime else {}
+    offsets = footage_offsets(paths, mtime_starts)
+    store = DryRunStore() if dry_run else None
+    processor = FaceProcessor(encoder=InlineEncoder(), store=store)
+    footage_clock = [0.0]
+    processor.cache = TTLCache(maxsize=500, ttl=3600, timer=lambda: footage_clock[0])
+    processor.pending = PendingEnrollmentBuffer.from_config(
+        timer=lambda: footage_clock[0]
+    )
+
+    tasks = plan_tasks(paths, interval, workers)
+    timings = dict.fromkeys(STAGES, 0.0)
+    totals = Counter()
+    rejected = Counter()
+    file_base, last_path = 0.0, None
+    file_start = None
+
+    wall_started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for task, segment in zip(tasks, pool.map(_scan_task, tasks)):
+            path = task[0]
+            if path != last_path:
+                file_base, last_path = offsets[path], path
+                if start_from_mtime:
+                    file_start = mtime_starts[path]
+                elif start_time is not None:
+                    file_start = start_time + datetime.timedelta(seconds=file_base)
+            for stage, seconds in segment["timings"].items():
+                timings[stage] += seconds
+            rejected.update(segment["rejected"])
+
+            for offset, encodings in segment["frames"]:
+                footage_clock[0] = file_base + offset
+                visited_at = None
+                if file_start is not None:
+                    visited_at = file_start + datetime.timedelta(seconds=offset)
+                totals["frames"] += 1
+                totals["faces"] += len(encodings)
+                for encoding in encodings:
+                    started = time.perf_counter()
+                    customer_id, distance = processor.match_with_distance(encoding)
+                    timings["match"] += time.perf_counter() - started
+
+                    started = time.perf_counter()
+                    result = processor.record(
+                        encoding, customer_id, distance=distance, visited_at=visited_at
+                    )
+                    timings["persist"] += time.perf_counter() - started
+                    if result:
+                        totals["new_customers" if result["new"] else "visits"] += 1
+    elapsed = time.perf_counter() - wall_started
+
+    frames = totals["frames"]
+    return {
+        "files": len({task[0] for task in tasks}),
+        "workers": workers,
+        "dry_run": dry_run,
+        "elapsed_s": round(elapsed, 3),
+        "frames": frames,
+        "faces": totals["faces"],
+        "new_customers": totals["new_customers"],
+        "visits": totals["visits"],
+        "rejected_faces": dict(rejected),
+        "frames_per_s": round(frames / elapsed, 2) if elapsed else 0.0,
+        "faces_per_s": round(totals["faces"] / elapsed, 2) if elapsed else 0.0,
+        "stages": {
+            stage: {
+                "total_s": round(seconds, 3),
+                "avg_ms_per_frame": round(seconds / frames * 1000, 2) if frames else 0,
+            }
+            for stage, seconds in timings.items()
+        },
+    }
+
+
+def print_report(report):
+    print(
+        f"Processed {report['frames']} frames from {report['files']} file(s) "
+        f"in {report['elapsed_s']:.1f} s with {report['workers']} worker(s)."
+    )
+    print(
+        f"  frames/s: {report['frames_per_s']}   faces/s: {report['faces_per_s']}"
+        f"   faces: {report['faces']}"
+    )
+    suffix = " (dry run, nothing written)" if report["dry_run"] else ""
+    print(
+        f"  new customers: {report['new_customers']}   "
+        f"visits: {report['visits']}{suffix}"
+    )
+    rejected = {k: v for k, v in report["rejected_faces"].items() if v}
+    if rejected:
+        print(f"  rejected by quality gate: {rejected}")
+    print(f"  {'stage':<10}{'total s':>10}{'ms/frame':>12}")
+    for stage, t in report["stages"].items():
+        print(f"  {stage:<10}{t['total_s']:>10.2f}{t['avg_ms_per_frame']:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("videos", nargs="+", help="Video files to process.")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds of footage between sampled frames (default: 1.0).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes; each file is split into this many ranges.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Match against the database but do not write to it.",
+    )
+    parser.add_argument(
+        "--start-time",
+        type=datetime.datetime.fromisoformat,
+        help="When the first file starts, e.g. 2024-05-01T09:00:00.",
+    )
+    parser.add_argument(
+        "--start-from-mtime",
+        action="store_true",
+        help="Date each file to end at its modification time.",
+    )
+    parser.add_argument("--json", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+    if not args.dry_run and args.start_time is None and not args.start_from_mtime:
+        parser.error(
+            "Visits are stored at footage time: give --start-time or "
+            "--start-from-mtime (or use --dry-run)."
+        )
+
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    report = run(
+        args.videos,
+        args.interval,
+        max(1, args.workers),
+        args.dry_run,
+        args.start_time,
+        args.start_from_mtime,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Per-call latency of the hot queries as plain text vs. prepared statements.
+
+    python -m benchmarks.bench_db --iterations 2000 --json db.json
+
+Runs against the MySQL database configured in .env. The writes (a new
+customer, a visit event) run on one connection, each mode in a transaction
+that is rolled back after it, so no rows are left behind (auto-increment
+counters do advance). The dashboard reads go through the real
+dashboard_queries functions, pool checkout included, once with
+DB_PREPARED_STATEMENTS off and once on.
+"""
+
+import argparse
+import datetime
+import json
+import time
+import uuid
+import numpy as np
+import database
+import dashboard_queries
+
+
+def _percentiles_us(samples):
+    p50, p95 = np.percentile(np.asarray(samples) * 1e6, [50, 95])
+    return {
+        "mean_us": round(float(np.mean(samples)) * 1e6, 1),
+        "p50_us": round(float(p50), 1),
+        "p95_us": round(float(p95), 1),
+    }
+
+
+def _customer_params(i):
+    encoding = np.random.default_rng(i).normal(0, 0.09, 128).tobytes()
+    return (str(uuid.uuid4()), None, None, encoding, datetime.datetime.now(), 1)
+
+
+def _visit_params(i):
+    return (f"bench-{i % 100}", "bench", datetime.datetime.now(), 0.4, False)
+
+
+WRITES = (
+    ("insert_customer", database.CUSTOMER_INSERT, _customer_params),
+    ("insert_visit", database.VISIT_INSERT, _visit_params),
+)
+READS = (
+    ("new_today", dashboard_queries.get_new_today),
+    ("visits_today", dashboard_queries.get_visits_today),
+    ("visit_trend", dashboard_queries.get_visit_trend),
+    ("top_visitors", dashboard_queries.get_top_visitors),
+)
+
+
+def bench_writes(iterations, warmup):
+    results = []
+    conn = database.get_connection()
+    try:
+        for name, query, make_params in WRITES:
+            timings = {}
+            for mode in ("text", "prepared"):
+                # Fresh rows per mode: unique_id is UNIQUE, and each mode's
+                # rows are rolled back before the next one runs.
+                params = [make_params(i) for i in range(warmup + iterations)]
+                samples = []
+                cursor = conn.cursor()
+                for i, p in enumerate(params):
+                    started = time.perf_counter()
+                    if mode == "text":
+                        cursor.execute(query, p)
+                    else:
+                        conn.execute_prepared(query, p)
+                    if i >= warmup:
+                        samples.append(time.perf_counter() - started)
+                cursor.close()
+                conn.rollback()
+                timings[mode] = _percentiles_us(samples)
+            results.append({"query": name, **timings})
+    finally:
+        conn.rollback()
+        conn.close()
+    return results
+
+
+def bench_reads(iterations, warmup):
+    results = []
+    for name, func in READS:
+        timings = {}
+        for mode in ("text", "prepared"):
+            database.PREPARED_STATEMENTS = mode == "prepared"
+            samples = []
+            for i in range(warmup + iterations):
+                started = time.perf_counter()
+                func()
+                if i >= warmup:
+                    samples.append(time.perf_counter() - started)
+            timings[mode] = _percentiles_us(samples)
+        results.append({"query": name, **timings})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = bench_writes(args.iterations, args.warmup)
+    results += bench_reads(args.iterations, args.warmup)
+
+    print(f"{'query':<18}{'text p50':>12}{'prepared p50':>14}{'speedup':>10}")
+    for r in results:
+        text, prepared = r["text"]["p50_us"], r["prepared"]["p50_us"]
+        r["speedup"] = round(text / prepared, 2) if prepared else None
+        print(
+            f"{r['query']:<18}{text:>10.1f}us{prepared:>12.1f}us{r['speedup']:>9.2f}x"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"iterations": args.iterations, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
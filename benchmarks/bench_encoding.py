@@ -0,0 +1,135 @@
+"""Encoding speed vs. match accuracy for each landmark model / jitter count.
+
+    python -m benchmarks.bench_encoding path/to/faces --jitters 1 5 --json out.json
+
+`path/to/faces` holds one sub-directory per person with a few photos each
+(a slice of LFW works well). Faces are detected once up front; then, for
+every combination of landmark model and jitter count, each face is encoded
+and the report shows ms/face next to:
+
+- verification at the 0.6 match threshold over all image pairs (rate of
+  same-person pairs accepted, different-person pairs wrongly accepted, and
+  the balanced accuracy of the two);
+- rank-1 identification (leave-one-out nearest neighbour).
+"""
+
+import argparse
+import itertools
+import json
+import os
+import time
+import numpy as np
+import face_recognition
+from encoders import create_encoder, LANDMARK_MODELS
+
+MATCH_THRESHOLD = 0.6
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def load_faces(root):
+    """Returns [(label, rgb_image, face_location)] using the largest face per image."""
+    faces = []
+    for label in sorted(os.listdir(root)):
+        person_dir = os.path.join(root, label)
+        if not os.path.isdir(person_dir):
+            continue
+        for name in sorted(os.listdir(person_dir)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            image = face_recognition.load_image_file(os.path.join(person_dir, name))
+            locations = face_recognition.face_locations(image)
+            if not locations:
+                continue
+            largest = max(locations, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+            faces.append((label, image, largest))
+    return faces
+
+
+def score(encodings, labels):
+    encodings = np.asarray(encodings)
+    labels = np.asarray(labels)
+    distances = np.linalg.norm(encodings[:, None, :] - encodings[None, :, :], axis=2)
+
+    same, different = [], []
+    for i, j in itertools.combinations(range(len(labels)), 2):
+        accepted = distances[i, j] < MATCH_THRESHOLD
+        (same if labels[i] == labels[j] else different).append(accepted)
+    true_accept = float(np.mean(same)) if same else 0.0
+    false_accept = float(np.mean(different)) if different else 0.0
+
+    np.fill_diagonal(distances, np.inf)
+    probes = [i for i in range(len(labels)) if (labels == labels[i]).sum() > 1]
+    rank1 = (
+        float(np.mean([labels[np.argmin(distances[i])] == labels[i] for i in probes]))
+        if probes
+        else 0.0
+    )
+    return {
+        "true_accept_rate": round(true_accept, 4),
+        "false_accept_rate": round(false_accept, 4),
+        "balanced_accuracy": round((true_accept + 1 - false_accept) / 2, 4),
+        "rank1_accuracy": round(rank1, 4),
+    }
+
+
+def bench(faces, backend, landmark_model, num_jitters):
+    encoder = create_encoder(backend, landmark_model, num_jitters)
+    try:
+        label, image, location = faces[0]
+        encoder.encode(image, [location])  # Warm-up
+        encodings = []
+        started = time.perf_counter()
+        for label, image, location in faces:
+            encodings.append(encoder.encode(image, [location])[0])
+        elapsed = time.perf_counter() - started
+    finally:
+        encoder.close()
+    result = {
+        "backend": backend,
+        "landmark_model": landmark_model,
+        "num_jitters": num_jitters,
+        "faces": len(faces),
+        "ms_per_face": round(elapsed / len(faces) * 1000, 2),
+    }
+    result.update(score(encodings, [f[0] for f in faces]))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("faces_dir", help="Directory with one folder per person.")
+    parser.add_argument("--backend", default="inline", help="inline, chips, process")
+    parser.add_argument(
+        "--models", nargs="+", default=list(LANDMARK_MODELS), choices=LANDMARK_MODELS
+    )
+    parser.add_argument("--jitters", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    faces = load_faces(args.faces_dir)
+    if not faces:
+        parser.error(f"No faces found under {args.faces_dir}")
+    print(f"{len(faces)} faces of {len({f[0] for f in faces})} people.")
+
+    results = [
+        bench(faces, args.backend, model, jitters)
+        for model in args.models
+        for jitters in args.jitters
+    ]
+    print(
+        f"{'model':<8}{'jitters':>8}{'ms/face':>10}{'TAR':>8}{'FAR':>8}"
+        f"{'bal.acc':>9}{'rank-1':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['landmark_model']:<8}{r['num_jitters']:>8}{r['ms_per_face']:>10.2f}"
+            f"{r['true_accept_rate']:>8.3f}{r['false_accept_rate']:>8.3f}"
+            f"{r['balanced_accuracy']:>9.3f}{r['rank1_accuracy']:>8.3f}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""End-to-end benchmark of FaceProcessor.process_frame.
+
+    python -m benchmarks.bench_pipeline --faces-dir path/to/faces \\
+        --faces 0 1 5 20 --galleries 1000 100000 1000000 --json run.json
+    python -m benchmarks.bench_pipeline --recording recordings/counter
+
+Frames are either synthetic (a 1280x720 noise canvas with 0, 1, 5 or 20
+face crops from `--faces-dir` tiled onto it, same layout as bench_encoding)
+or the frames of a recording made with recording.py. Each frame runs
+through the real process_frame against a store pre-filled with a gallery
+of random encodings: in memory, or with `--store sqlite` a throwaway
+SQLite database, which adds real writes to the db stage. Neither needs
+MySQL.
+
+Per case the report gives frames/s, p50/p95/p99 latency per stage
+(convert, detect, quality, encode, search, db) and in total, and the peak
+RSS of the process that ran it (where it can be measured: `resource` on
+Linux and macOS, psutil if installed on Windows). Every gallery size runs in its own
+process, so the RSS figures do not accumulate. Results (with the git
+commit) can be saved as JSON to compare runs across commits.
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+STAGES = ("convert", "detect", "quality", "encode", "search", "db")
+CANVAS_SIZE = (720, 1280)  # height, width
+
+
+class InMemoryStore:
+    """The customer functions of the database module, backed by a list."""
+
+    def __init__(self, customers):
+        self.customers = customers
+        self.visits = 0
+
+    def fetch_all_customers_for_rec(self):
+        return self.customers
+
+    def insert_customer(
+        self,
+        unique_id,
+        name,
+        email,
+        face_encoding,
+        last_visited,
+        visit_count,
+        camera_id=None,
+    ):
+        self.customers.append(
+            {
+                "unique_id": unique_id,
+                "name": name,
+                "email": email,
+                "face_encoding": face_encoding,
+            }
+        )
+        return len(self.customers)  # Stands in for the row id
+
+    def update_customer_visit(
+        self, unique_id, camera_id=None, distance=None, visited_at=None
+    ):
+        self.visits += 1
+
+
+def make_gallery(size, seed=0):
+    """Random 128-d encodings spread like real ones (unit-ish norm)."""
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(0, 0.09, size=(size, 128))
+    return [
+        {
+            "unique_id": f"bench-{i}",
+            "name": None,
+            "email": None,
+            "face_encoding": encoding.tobytes(),
+        }
+        for i, encoding in enumerate(encodings)
+    ]
+
+
+def make_store(kind, gallery):
+    """Returns (store, cleanup) holding `gallery`, for `kind` memory or sqlite."""
+    if kind == "memory":
+        return InMemoryStore(gallery), lambda: None
+    from storage import SQLiteStore
+
+    directory = tempfile.mkdtemp(prefix="bench-pipeline-")
+    store = SQLiteStore(os.path.join(directory, "bench.db"))
+    with store.conn:
+        store.conn.executemany(
+            "INSERT INTO customers (unique_id, face_encoding, visit_count) "
+            "VALUES (?, ?, 1)",
+            ((c["unique_id"], c["face_encoding"]) for c in gallery),
+        )
+
+    def cleanup():
+        store.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return store, cleanup
+
+
+def face_crops(faces_dir, limit):
+    """Returns up to `limit` BGR face crops (with some margin) from `faces_dir`."""
+    from benchmarks.bench_encoding import load_faces
+
+    crops = []
+    for label, image, (top, right, bottom, left) in load_faces(faces_dir):
+        margin = (bottom - top) // 2
+        crop = image[
+            max(0, top - margin) : bottom + margin,
+            max(0, left - margin) : right + margin,
+        ]
+        crops.append(cv2.cvtColor(crop, cv2.COLOR_RGB2BGR))
+        if len(crops) >= limit:
+            break
+    return crops
+
+
+def synthetic_frame(crops, count, seed=0):
+    """A noise canvas with `count` crops tiled onto a near-square grid."""
+    rng = np.random.default_rng(seed)
+    height, width = CANVAS_SIZE
+    frame = rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+    if not count:
+        return frame
+    cols = math.ceil(math.sqrt(count * width / height))
+    rows = math.ceil(count / cols)
+    cell_h, cell_w = height // rows, width // cols
+    for i in range(count):
+        crop = crops[i % len(crops)]
+        scale = min(cell_h / crop.shape[0], cell_w / crop.shape[1])
+        resized = cv2.resize(
+            crop, (int(crop.shape[1] * scale), int(crop.shape[0] * scale))
+        )
+        y, x = (i // cols) * cell_h, (i % cols) * cell_w
+        frame[y : y + resized.shape[0], x : x + resized.shape[1]] = resized
+    return frame
+
+
+def recorded_frames(path, limit):
+    from recording import ReplayCapture
+
+    cap = ReplayCapture(path, speed=0)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+class _Timed:
+    """Proxies `target`, adding the run time of the named methods to `spent`."""
+
+    def __init__(self, target, methods, spent):
+        self._target = target
+        self._methods = methods  # method name -> stage
+        self._spent = spent
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        stage = self._methods.get(name)
+        if stage is None:
+            return attr
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self._spent[stage] += time.perf_counter() - started
+
+        return timed
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB, or None if unavailable."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+
+
+def run_gallery(gallery_size, cases, iterations, warmup, quality_gate, store_kind):
+    """Runs every (name, frames) case against one gallery. Runs in a child."""
+    from main import FaceProcessor
+    from quality import FaceQualityGate
+
+    started = time.perf_counter()
+    store, cleanup = make_store(store_kind, make_gallery(gallery_size))
+    spent = defaultdict(float)
+    if quality_gate:
+        gate = FaceQualityGate.from_config()
+    else:
+        gate = FaceQualityGate(enabled=False)
+    processor = FaceProcessor(store=store, quality_gate=gate)
+    load_s = time.perf_counter() - started
+
+    processor.encoder = _Timed(
+        processor.encoder, {"detect": "detect", "encode": "encode"}, spent
+    )
+    processor.quality_gate = _Timed(gate, {"filter": "quality"}, spent)
+    processor.store = _Timed(
+        store, {"insert_customer": "db", "update_customer_visit": "db"}, spent
+    )
+    detect, match = processor.detect, processor.match_with_distance
+    detected = []
+
+    def timed_detect(frame, *args):
+        started = time.perf_counter()
+        rgb_frame, face_locations = detect(frame, *args)
+        # detect() is colour conversion + detection + quality gate.
+        spent["convert"] += (
+            time.perf_counter() - started - spent["detect"] - spent["quality"]
+        )
+        detected.append(len(face_locations))
+        return rgb_frame, face_locations
+
+    def timed_match(encoding):
+        started = time.perf_counter()
+        try:
+            return match(encoding)
+        finally:
+            spent["search"] += time.perf_counter() - started
+
+    processor.detect, processor.match_with_distance = timed_detect, timed_match
+
+    results = []
+    for name, frames in cases:
+        samples = defaultdict(list)
+        for i in range(warmup):
+            processor.process_frame(frames[i % len(frames)])
+        detected.clear()
+        wall_started = time.perf_counter()
+        for i in range(iterations):
+            spent.clear()
+            frame_started = time.perf_counter()
+            processor.process_frame(frames[i % len(frames)])
+            total = time.perf_counter() - frame_started
+            for stage in STAGES:
+                samples[stage].append(spent[stage])
+            samples["total"].append(total)
+        elapsed = time.perf_counter() - wall_started
+        results.append(
+            {
+                "case": name,
+                "gallery": gallery_size,
+                "frames": iterations,
+                "faces_per_frame": round(float(np.mean(detected)), 2),
+                "frames_per_s": round(iterations / elapsed, 2) if elapsed else None,
+                "latency_ms": {
+                    stage: _percentiles(samples[stage]) for stage in STAGES + ("total",)
+                },
+            }
+        )
+
+    peak = peak_rss_mb()
+    for result in results:
+        result["gallery_load_s"] = round(load_s, 3)
+        result["peak_rss_mb"] = round(peak, 1) if peak is not None else None
+    processor.close()
+    cleanup()
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"commit {report['commit']}  {report['timestamp']}")
+    header = f"{'case':<14}{'gallery':>9}{'fps':>10}{'rss MB':>9}"
+    for stage in STAGES + ("total",):
+        header += f"{stage + ' p50/p99':>18}"
+    print(header)
+    for r in report["results"]:
+        rss = r["peak_rss_mb"]
+        line = (
+            f"{r['case']:<14}{r['gallery']:>9}{r['frames_per_s']:>10.1f}"
+            f"{'n/a' if rss is None else f'{rss:.1f}':>9}"
+        )
+        for stage in STAGES + ("total",):
+            p = r["latency_ms"][stage]
+            line += f"{p['p50']:>9.2f}/{p['p99']:<8.2f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--faces-dir", help="Face photos for synthetic frames.")
+    parser.add_argument("--recording", help="Recording directory to replay.")
+    parser.add_argument("--faces", nargs="+", type=int, default=[0, 1, 5, 20])
+    parser.add_argument(
+        "--galleries", nargs="+", type=int, default=[1000, 100000, 1000000]
+    )
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--store", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument(
+        "--no-quality-gate",
+        action="store_true",
+        help="Disable the quality gate (tiled crops can fail the yaw check).",
+    )
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    cases = []
+    crops = face_crops(args.faces_dir, max(args.faces)) if args.faces_dir else []
+    for count in args.faces:
+        if count and not crops:
+            print(f"Skipping {count}-face frames: no --faces-dir given.")
+            continue
+        cases.append((f"synthetic-{count}", [synthetic_frame(crops, count)]))
+    if args.recording:
+        frames = recorded_frames(args.recording, args.iterations)
+        if frames:
+            cases.append(("recorded", frames))
+    if not cases:
+        parser.error("Nothing to run.")
+
+    results = []
+    # A fresh process per gallery, so each peak RSS stands on its own.
+    context = multiprocessing.get_context("spawn")
+    for size in args.galleries:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.extend(
+                pool.submit(
+                    run_gallery,
+                    size,
+                    cases,
+                    args.iterations,
+                    args.warmup,
+                    not args.no_quality_gate,
+                    args.store,
+                ).result()
+            )
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
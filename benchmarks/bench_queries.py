@@ -0,0 +1,196 @@
+"""Dashboard and report queries before and after the customer indexes.
+
+    python -m benchmarks.bench_queries --rows 1000000 --json queries.json
+
+Fills a throwaway SQLite database (through SQLiteStore, so with the real
+migrations) with `--rows` customers whose last visits spread over the past
+year, then times each query twice:
+
+- before: migration 3 rolled back (no index on last_visited or
+  visit_count) and the queries as they were written before it, filtering
+  on DATE(last_visited);
+- after: migration 3 applied and the queries the store runs now, as range
+  predicates on the bare column.
+
+The report gives the median and p95 per query and the query plans. The
+encodings are left empty to keep the file small; they play no part in
+these queries. No MySQL is needed.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+import migrations
+from storage import SQLiteStore
+
+# The queries as written before migration 3, in SQLite's dialect.
+LEGACY = {
+    "new_today": (
+        "SELECT COUNT(*) FROM customers "
+        "WHERE date(COALESCE(last_visited, datetime('now', 'localtime'))) "
+        "= date('now', 'localtime') AND visit_count = 1",
+        (),
+    ),
+    "top_visitors": (
+        "SELECT COALESCE(name, unique_id) AS visitor_name, visit_count "
+        "FROM customers ORDER BY visit_count DESC LIMIT ?",
+        (5,),
+    ),
+    "visit_data_7d": (
+        "SELECT unique_id, name, email, last_visited, visit_count FROM customers "
+        "WHERE date(last_visited) BETWEEN ? AND ? ORDER BY last_visited DESC",
+        None,  # Filled in with the date range
+    ),
+}
+
+
+def fill(store, rows):
+    """Inserts `rows` customers; about a third have visited once."""
+    with store.lock, store.conn:
+        store.conn.execute(
+            """
+            INSERT INTO customers (unique_id, face_encoding, last_visited, visit_count)
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+            SELECT
+                'bench-' || i,
+                x'',
+                CASE WHEN i % 100 = 0 THEN NULL ELSE datetime(
+                    'now', 'localtime', '-' || (abs(random()) % 525600) || ' minutes'
+                ) END,
+                CASE WHEN i % 3 = 0 THEN 1 ELSE 2 + abs(random()) % 60 END
+            FROM n
+            """,
+            (rows,),
+        )
+        store.conn.execute("ANALYZE")
+
+
+def rollback_indexes(store):
+    """Undoes migration 3, leaving the table as it was before it."""
+    with store.lock, store.conn:
+        store.conn.execute("DROP INDEX IF EXISTS idx_customers_last_visited")
+        store.conn.execute("DROP INDEX IF EXISTS idx_customers_visit_count")
+        store.conn.execute("DELETE FROM schema_migrations WHERE version = 3")
+        store.conn.execute("ANALYZE")
+
+
+def _time(run, iterations):
+    run()  # Warm the page cache
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    p50, p95 = np.percentile(np.asarray(samples) * 1000, [50, 95])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3)}
+
+
+def _plan(store, sql, params=()):
+    with store.lock:
+        rows = store.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def _traced_sql(store, call):
+    """The SQL (with its parameters inlined) that `call` runs on the store."""
+    statements = []
+    store.conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        store.conn.set_trace_callback(None)
+    return statements[-1]
+
+
+def bench_before(store, start, end, iterations):
+    results = {}
+    for name, (sql, params) in LEGACY.items():
+        params = (str(start), str(end)) if params is None else params
+
+        def run(sql=sql, params=params):
+            with store.lock:
+                return store.conn.execute(sql, params).fetchall()
+
+        results[name] = {
+            **_time(run, iterations),
+            "rows": len(run()),
+            "plan": _plan(store, sql, params),
+        }
+    return results
+
+
+def bench_after(store, start, end, iterations):
+    calls = {
+        "new_today": store.get_new_today,
+        "top_visitors": lambda: store.get_top_visitors(5),
+        "visit_data_7d": lambda: store.get_visit_data(start, end),
+    }
+    results = {}
+    for name, call in calls.items():
+        result = call()
+        results[name] = {
+            **_time(call, iterations),
+            "rows": len(result) if isinstance(result, list) else 1,
+            "plan": _plan(store, _traced_sql(store, call)),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="bench-queries-")
+    try:
+        store = SQLiteStore(os.path.join(directory, "bench.db"))
+        started = time.perf_counter()
+        fill(store, args.rows)
+        print(f"Filled {args.rows} customers in {time.perf_counter() - started:.1f}s.")
+        end = datetime.date.today()
+        start = end - datetime.timedelta(days=6)
+
+        rollback_indexes(store)
+        before = bench_before(store, start, end, args.iterations)
+        started = time.perf_counter()
+        migrations.migrate(store)
+        with store.lock:
+            store.conn.execute("ANALYZE")
+        print(f"Applied migration 3 in {time.perf_counter() - started:.1f}s.")
+        after = bench_after(store, start, end, args.iterations)
+        store.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(
+        f"{'query':<16}{'before p50':>12}{'after p50':>12}{'speedup':>10}"
+        f"{'before p95':>12}{'after p95':>12}"
+    )
+    for name in LEGACY:
+        b, a = before[name], after[name]
+        speedup = b["p50_ms"] / a["p50_ms"] if a["p50_ms"] else float("inf")
+        print(
+            f"{name:<16}{b['p50_ms']:>10.2f}ms{a['p50_ms']:>10.2f}ms{speedup:>9.1f}x"
+            f"{b['p95_ms']:>10.2f}ms{a['p95_ms']:>10.2f}ms"
+        )
+    for label, results in (("before", before), ("after", after)):
+        print(f"\nPlans {label}:")
+        for name, result in results.items():
+            print(f"  {name}: {'; '.join(result['plan'])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"rows": args.rows, "before": before, "after": after}, f, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
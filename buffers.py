@@ -0,0 +1,61 @@
+import threading
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBufferPool:
+    """Reusable image buffers for one camera's frame path.
+
+    Frames are large (~6 MB at 1080p) and each one used to be allocated
+    several times on its way through capture, colour conversion and ROI
+    cropping. Stages instead `acquire()` a buffer of the shape they need,
+    write into it (cv2 `dst=`, `VideoCapture.read(image)`, `np.copyto`) and
+    `release()` it when the frame is done with, so in steady state frames
+    cycle through the same few buffers, including those of frames dropped
+    from a full pipeline queue. Buffers that are never released are simply
+    garbage collected and replaced by a new allocation, which shows up in
+    the stats.
+    """
+
+    def __init__(self, name=None, max_free=4):
+        self.name = name
+        self.max_free = max_free  # Idle buffers kept per shape
+        self.lock = threading.Lock()
+        self.free = {}  # (shape, dtype) -> [buffers]
+        self.allocations = 0
+        self.reuses = 0
+        self.discarded = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Returns an uninitialised C-contiguous array of `shape`."""
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self.lock:
+            free = self.free.get(key)
+            if free:
+                self.reuses += 1
+                return free.pop()
+            self.allocations += 1
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buffer):
+        """Returns `buffer` to the pool; the caller must not use it afterwards."""
+        if buffer is None or not buffer.flags.c_contiguous or buffer.base is not None:
+            return  # Views of other arrays are not ours to recycle
+        key = (buffer.shape, buffer.dtype.str)
+        with self.lock:
+            free = self.free.setdefault(key, [])
+            if len(free) < self.max_free:
+                free.append(buffer)
+            else:
+                self.discarded += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "allocations": self.allocations,
+                "reuses": self.reuses,
+                "discarded": self.discarded,
+                "free": sum(len(free) for free in self.free.values()),
+            }
@@ -0,0 +1,147 @@
+import cv2
+import os
+import threading
+import time
+from recording import open_capture, is_replay
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrameCapture:
+    """Reads a camera on a dedicated thread and keeps only the newest frame.
+
+    OpenCV buffers frames internally, so reading synchronously after a slow
+    frame hands back images that are seconds old. Here the device is drained
+    continuously into a single slot (older frames are dropped) and consumers
+    always get the freshest frame together with its capture timestamp.
+
+    Video files are read at their native frame rate, like a live camera, and
+    the capture ends (`ended` is set) when the file runs out. `replay://`
+    recordings pace themselves from their timestamps and end the same way.
+
+    With a FrameBufferPool, frames are decoded into pooled buffers and
+    dropped frames go straight back to the pool; a frame returned by read()
+    belongs to the caller, who releases it when done.
+    """
+
+    def __init__(self, source, name=None, buffers=None):
+        self.source = source
+        self.name = name if name is not None else str(source)
+        self.buffers = buffers
+        self.frame_shape = None
+        self.cap = None
+        self.thread = None
+        self.running = False
+        self.ended = False
+        self.is_replay = is_replay(source)
+        self.is_file = self.is_replay or (
+            isinstance(source, str) and os.path.isfile(source)
+        )
+        self.frame_interval = 0.0
+        self.cond = threading.Condition()
+        self.frame = None
+        self.frame_ts = None  # time.time() when the slot was filled
+        self.frame_seq = 0
+        self.last_read_seq = 0
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.read_failures = 0
+
+    def start(self):
+        """Opens the device and starts the reader thread. Returns True on success."""
+        self.cap = open_capture(self.source)
+        if not self.cap.isOpened():
+            logger.error(f"Error: Could not open capture source {self.name}.")
+            self.cap.release()
+            self.cap = None
+            return False
+        if self.is_file and not self.is_replay:
+            fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+            self.frame_interval = 1.0 / fps
+        self.running = True
+        self.ended = False
+        self.thread = threading.Thread(
+            target=self._reader, name=f"capture-{self.name}", daemon=True
+        )
+        self.thread.start()
+        logger.info(f"Capture thread started for source {self.name}.")
+        return True
+
+    def _reader(self):
+        next_due = time.monotonic()
+        while self.running:
+            if self.frame_interval:
+                next_due += self.frame_interval
+                time.sleep(max(0.0, next_due - time.monotonic()))
+            buffer = None
+            if self.buffers is not None and self.frame_shape is not None:
+                buffer = self.buffers.acquire(self.frame_shape)
+            ret, frame = self.cap.read(buffer)
+            captured_at = time.time()
+            if buffer is not None and not (ret and frame is buffer):
+                # Read failed or the resolution changed; OpenCV allocated anew.
+                self.buffers.release(buffer)
+            if not ret and self.is_file:
+                logger.info(f"Video source {self.name} reached end of file.")
+                with self.cond:
+                    self.ended = True
+                    self.running = False
+                    self.cond.notify_all()
+                break
+            if not ret:
+                self.read_failures += 1
+                logger.warning(f"Could not read frame from source {self.name}.")
+                time.sleep(1)
+                continue
+
+            self.frame_shape = frame.shape
+            with self.cond:
+                if self.frame_seq > self.last_read_seq:
+                    # The previous frame was never consumed.
+                    self.frames_dropped += 1
+                    if self.buffers is not None:
+                        self.buffers.release(self.frame)
+                self.frame = frame
+                self.frame_ts = captured_at
+                self.frame_seq += 1
+                self.frames_captured += 1
+                self.cond.notify_all()
+
+    def read(self, timeout=1.0):
+        """Returns (frame, captured_at) for the newest unseen frame.
+
+        Blocks up to `timeout` seconds for a frame newer than the last one
+        returned; gives (None, None) if nothing arrives in time.
+        """
+        with self.cond:
+            self.cond.wait_for(
+                lambda: self.frame_seq > self.last_read_seq or not self.running,
+                timeout,
+            )
+            if self.frame_seq <= self.last_read_seq:
+                return None, None
+            self.last_read_seq = self.frame_seq
+            return self.frame, self.frame_ts
+
+    def stop(self):
+        """Stops the reader thread and releases the device."""
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=5)
+            if self.thread.is_alive():
+                logger.warning(f"Capture thread for {self.name} did not stop cleanly.")
+        self.thread = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        logger.info(f"Capture source {self.name} released.")
+
+    def get_stats(self):
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_dropped": self.frames_dropped,
+            "read_failures": self.read_failures,
+        }
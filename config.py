@@ -1,9 +1,18 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
+
+def _env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 # --- Security ---
 SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_change_me")
 API_KEY_SECRET = os.getenv("API_KEY_SECRET", "default_api_key_change_me")
@@ -14,8 +23,77 @@ DB_CONFIG = {
     "user": os.getenv("DB_USER", "root"),
     "password": os.getenv("DB_PASSWORD", "Dine@2003"),
     "database": os.getenv("DB_NAME", "face_recognition"),
-    "pool_name": "face_rec_pool",
-    "pool_size": 5,
+}
+
+# The chatbot's schema description is cached; a question checks the schema
+# version (one small query) at most every `check_interval` seconds and only
+# reloads the description when it changed.
+SCHEMA_CACHE_CHECK_INTERVAL = float(os.getenv("SCHEMA_CACHE_CHECK_INTERVAL", 60))
+
+# Guards for chatbot-generated SQL: statement timeout, rows and bytes of
+# result kept (the rest is cut and flagged), and the largest full-table scan
+# (by the optimizer's row estimate) a query may plan; 0 disables that check.
+CHAT_QUERY_LIMITS = {
+    "timeout_ms": int(os.getenv("CHAT_QUERY_TIMEOUT_MS", 5000)),
+    "max_rows": int(os.getenv("CHAT_QUERY_MAX_ROWS", 200)),
+    "max_bytes": int(os.getenv("CHAT_QUERY_MAX_BYTES", 64 * 1024)),
+    "max_scan_rows": int(os.getenv("CHAT_QUERY_MAX_SCAN_ROWS", 500000)),
+}
+
+# Storage backend: "mysql" (the server in DB_CONFIG) or "sqlite", an
+# embedded database file in WAL mode at SQLITE_PATH (no server needed).
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "facetrack.db")
+
+# Pool for the recognition path (visit writes, enrollments, encoding loads):
+# `size` connections are kept open; up to `max_overflow` more are opened
+# under load and closed again when returned. A checkout waits up to
+# `timeout` seconds for a free connection before failing. Connections older
+# than `max_age` seconds are replaced, and with `pre_ping` idle connections
+# are checked before they are handed out.
+DB_POOL = {
+    "size": int(os.getenv("DB_POOL_SIZE", 5)),
+    "max_overflow": int(os.getenv("DB_POOL_MAX_OVERFLOW", 5)),
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", 10.0)),
+    "max_age": float(os.getenv("DB_POOL_MAX_AGE", 3600)),
+    "pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+}
+
+# Dashboard, report and chatbot reads have a pool of their own, so however
+# long they run they can only wait on each other; the pool above is left to
+# the recognition writes. Its checkouts fail sooner, its sessions are read
+# only, and every statement on it is stopped after `statement_timeout_ms`
+# (0: no limit). With DB_READ_HOST set, reads go to that replica instead of
+# DB_HOST (counts may then trail the writes by the replication lag).
+DB_READ_POOL = {
+    "size": int(os.getenv("DB_READ_POOL_SIZE", 3)),
+    "max_overflow": int(os.getenv("DB_READ_POOL_MAX_OVERFLOW", 2)),
+    "timeout": float(os.getenv("DB_READ_POOL_TIMEOUT", 5.0)),
+    "max_age": float(os.getenv("DB_POOL_MAX_AGE", 3600)),
+    "pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    "statement_timeout_ms": int(os.getenv("DB_READ_STATEMENT_TIMEOUT_MS", 30000)),
+}
+DB_READ_CONFIG = {
+    **DB_CONFIG,
+    "host": os.getenv("DB_READ_HOST") or DB_CONFIG["host"],
+    "user": os.getenv("DB_READ_USER") or DB_CONFIG["user"],
+    "password": os.getenv("DB_READ_PASSWORD") or DB_CONFIG["password"],
+}
+if os.getenv("DB_READ_PORT"):
+    DB_READ_CONFIG["port"] = int(os.getenv("DB_READ_PORT"))
+
+# Hot recognition and dashboard queries run as server-side prepared
+# statements, prepared once per pooled connection.
+PREPARED_STATEMENTS = _env_bool("DB_PREPARED_STATEMENTS", True)
+
+# Visit events for the `visits` table are queued and inserted every
+# `flush_interval` seconds in bulk, after which the customer counters are
+# rolled forward from them. At most `max_pending` events wait before they
+# are inserted synchronously (as they always are with the queue disabled).
+VISIT_QUEUE = {
+    "enabled": _env_bool("VISIT_QUEUE_ENABLED", True),
+    "flush_interval": float(os.getenv("VISIT_QUEUE_FLUSH_INTERVAL", 1.0)),
+    "max_pending": int(os.getenv("VISIT_QUEUE_MAX_PENDING", 10000)),
 }
 
 # --- LLM ---
@@ -31,6 +109,121 @@ SMTP_CONFIG = {
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL")
 
 
+# --- Cameras ---
+def _parse_camera_source(value):
+    """USB camera indexes are ints; RTSP/HTTP URLs and file paths stay strings."""
+    value = str(value).strip()
+    return int(value) if value.isdigit() else value
+
+
+# Either a JSON file with a list of {"id": ..., "source": ...} objects, or a
+# comma-separated CAMERA_SOURCES list (ids become cam0, cam1, ...). File
+# entries may add an "roi": a list of pixel rectangles [x, y, w, h] and/or
+# polygons [[x, y], ...]; faces are then only detected inside those regions.
+CAMERAS_FILE = os.getenv("CAMERAS_FILE", "cameras.json")
+if os.path.exists(CAMERAS_FILE):
+    with open(CAMERAS_FILE) as f:
+        CAMERAS = json.load(f)
+    for camera in CAMERAS:
+        camera["id"] = str(camera["id"])
+        camera["source"] = _parse_camera_source(camera["source"])
+else:
+    CAMERAS = [
+        {"id": f"cam{i}", "source": _parse_camera_source(source)}
+        for i, source in enumerate(os.getenv("CAMERA_SOURCES", "0").split(","))
+        if source.strip()
+    ]
+
+# --- Recognition ---
+# Minimum seconds between processed frames; the capture thread keeps draining
+# the camera in between so each processed frame is the freshest one.
+RECOGNITION_INTERVAL = float(os.getenv("RECOGNITION_INTERVAL", 1.0))
+
+# Recognition pipeline stages: worker threads, bounded queue size and what to
+# do when the queue is full ("block", "drop_oldest" or "drop_newest"). Only
+# the frame stages drop: a persist job is a visit or enrollment to write, so
+# persist blocks and the backpressure ends up dropping frames upstream.
+PIPELINE_CONFIG = {
+    "detect": {
+        "workers": int(os.getenv("PIPELINE_DETECT_WORKERS", 2)),
+        "queue_size": int(os.getenv("PIPELINE_DETECT_QUEUE", 2)),
+        "drop_policy": os.getenv("PIPELINE_DETECT_DROP", "drop_oldest"),
+    },
+    "encode": {
+        "workers": int(os.getenv("PIPELINE_ENCODE_WORKERS", 2)),
+        "queue_size": int(os.getenv("PIPELINE_ENCODE_QUEUE", 4)),
+        "drop_policy": os.getenv("PIPELINE_ENCODE_DROP", "drop_oldest"),
+        # Frames per encoder call; only the "chips" backend encodes a batch
+        # in one pass, the others loop over it.
+        "batch_size": int(os.getenv("PIPELINE_ENCODE_BATCH", 1)),
+    },
+    "match": {
+        "workers": int(os.getenv("PIPELINE_MATCH_WORKERS", 1)),
+        "queue_size": int(os.getenv("PIPELINE_MATCH_QUEUE", 16)),
+        "drop_policy": os.getenv("PIPELINE_MATCH_DROP", "block"),
+    },
+    "persist": {
+        "workers": int(os.getenv("PIPELINE_PERSIST_WORKERS", 1)),
+        "queue_size": int(os.getenv("PIPELINE_PERSIST_QUEUE", 64)),
+        "drop_policy": os.getenv("PIPELINE_PERSIST_DROP", "block"),
+    },
+}
+
+# Face encoding backend: "inline" encodes in the pipeline's encode threads
+# with face_recognition, "chips" aligns every face into a chip and runs the
+# descriptor network once per batch, "process" fans faces out to a pool of
+# ENCODING_WORKERS processes (raise PIPELINE_ENCODE_WORKERS too so several
+# frames can be in flight).
+ENCODING_BACKEND = os.getenv("ENCODING_BACKEND", "inline")
+# Landmarks used to align faces before encoding: "small" (5-point, fast) or
+# "large" (68-point, PREDICTOR_PATH for the chips backend). NUM_JITTERS > 1
+# averages that many jittered copies per face: slightly more accurate, but
+# roughly NUM_JITTERS times slower. See benchmarks/bench_encoding.py.
+LANDMARK_MODEL = os.getenv("LANDMARK_MODEL", "small")
+NUM_JITTERS = int(os.getenv("NUM_JITTERS", 1))
+ENCODING_WORKERS = int(os.getenv("ENCODING_WORKERS", os.cpu_count() or 1))
+# Also run face detection in the process pool.
+ENCODING_POOL_DETECT = _env_bool("ENCODING_POOL_DETECT")
+
+# Unknown faces are enrolled only after `min_frames` sightings spanning at
+# least `min_seconds`, grouped by distance (`tolerance`) to the running mean;
+# pending faces unseen for `max_gap` seconds are forgotten.
+ENROLLMENT_CONFIG = {
+    "min_frames": int(os.getenv("ENROLL_MIN_FRAMES", 3)),
+    "min_seconds": float(os.getenv("ENROLL_MIN_SECONDS", 0.0)),
+    "max_gap": float(os.getenv("ENROLL_MAX_GAP", 10.0)),
+    "tolerance": float(os.getenv("ENROLL_TOLERANCE", 0.5)),
+    "max_pending": int(os.getenv("ENROLL_MAX_PENDING", 200)),
+}
+
+# Faces failing any of these checks are skipped before encoding. Blur is the
+# variance of the Laplacian of the face crop (scaled to 112x112); yaw is a
+# rough head-turn estimate in degrees from the eye and nose landmarks.
+QUALITY_GATE = {
+    "enabled": _env_bool("QUALITY_GATE_ENABLED", True),
+    "min_face_size": int(os.getenv("QUALITY_MIN_FACE_SIZE", 60)),
+    "min_blur_score": float(os.getenv("QUALITY_MIN_BLUR_SCORE", 60.0)),
+    "max_yaw": float(os.getenv("QUALITY_MAX_YAW", 35.0)),
+    "min_brightness": float(os.getenv("QUALITY_MIN_BRIGHTNESS", 40.0)),
+    "max_brightness": float(os.getenv("QUALITY_MAX_BRIGHTNESS", 220.0)),
+}
+
+# Per-camera detection scale: starts at face_recognition's default (full
+# size, upsampled once) and moves to the cheapest scale at which the
+# `percentile`-th smallest recent face is still `margin` times the HOG
+# detector's `min_detectable` pixels. Every `probe_interval` frames one frame
+# is checked at the default scale and the level steps back up if it misses
+# faces.
+ADAPTIVE_DETECTION = {
+    "enabled": _env_bool("ADAPTIVE_DETECTION", True),
+    "min_detectable": int(os.getenv("DETECT_MIN_DETECTABLE", 80)),
+    "margin": float(os.getenv("DETECT_MARGIN", 1.25)),
+    "percentile": float(os.getenv("DETECT_SIZE_PERCENTILE", 10)),
+    "window": int(os.getenv("DETECT_SIZE_WINDOW", 200)),
+    "min_samples": int(os.getenv("DETECT_MIN_SAMPLES", 20)),
+    "probe_interval": int(os.getenv("DETECT_PROBE_INTERVAL", 30)),
+}
+
 # --- Paths ---
 PREDICTOR_PATH = os.getenv(
     "SHAPE_PREDICTOR_PATH", "shape_predictor_68_face_landmarks.dat"
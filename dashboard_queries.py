@@ -1,24 +1,16 @@
-from database import execute_query
+from storage import get_store
 
 
 def get_total_customers():
-    query = "SELECT COUNT(*) as total FROM customers"
-    result = execute_query(query, fetch_one=True)
-    return result["total"] if result else 0
+    return get_store().get_total_customers()
 
 
 def get_new_today():
-    query = "SELECT COUNT(*) as total FROM customers WHERE DATE(IFNULL(last_visited, NOW())) = CURDATE() AND visit_count = 1"
-    result = execute_query(query, fetch_one=True)
-    return result["total"] if result else 0
+    return get_store().get_new_today()
 
 
 def get_visits_today():
-    query = (
-        "SELECT COUNT(*) as total FROM customers WHERE DATE(last_visited) = CURDATE()"
-    )
-    result = execute_query(query, fetch_one=True)
-    return result["total"] if result else 0
+    return get_store().get_visits_today()
 
 
 def get_kpi_stats():
@@ -31,21 +23,8 @@ def get_kpi_stats():
 
 
 def get_visit_trend(days=10):
-    query = """
-        SELECT DATE(last_visited) as visit_date, COUNT(*) as visit_count
-        FROM customers
-        WHERE last_visited IS NOT NULL AND last_visited >= CURDATE() - INTERVAL %s DAY
-        GROUP BY DATE(last_visited)
-        ORDER BY visit_date ASC
-    """
-    return execute_query(query, (days,), fetch_all=True)
+    return get_store().get_visit_trend(days)
 
 
 def get_top_visitors(limit=5):
-    query = """
-        SELECT COALESCE(name, unique_id) as visitor_name, visit_count
-        FROM customers
-        ORDER BY visit_count DESC
-        LIMIT %s
-    """
-    return execute_query(query, (limit,), fetch_all=True)
+    return get_store().get_top_visitors(limit)
@@ -1,37 +1,301 @@
+import atexit
+import datetime
+from collections import OrderedDict
+import threading
+import time
 import mysql.connector
-from config import DB_CONFIG
+import numpy as np
+from config import (
+    CHAT_QUERY_LIMITS,
+    DB_CONFIG,
+    DB_POOL,
+    DB_READ_CONFIG,
+    DB_READ_POOL,
+    PREPARED_STATEMENTS,
+    VISIT_QUEUE,
+)
+import query_guard
+from query_guard import QueryRejected
 import logging
 
 logger = logging.getLogger(__name__)
 
-connection_pool = None
+connection_pools = {}  # "write" / "read" -> ConnectionPool
+MAX_PREPARED_PER_CONNECTION = 32
 
 
-def get_pool():
-    """Initializes and returns the connection pool."""
-    global connection_pool
-    if connection_pool is None:
+class PoolExhaustedError(mysql.connector.errors.PoolError):
+    """No connection became free within the checkout timeout."""
+
+
+class PooledConnection:
+    """A pooled MySQL connection; close() hands it back to its pool."""
+
+    def __init__(self, pool, cnx):
+        self._pool = pool
+        self._cnx = cnx
+        self.created_at = time.monotonic()
+        # query -> (query, prepared cursor), least recently used first
+        self.statements = OrderedDict()
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+    def execute_prepared(self, query, params=()):
+        """Executes `query` as a server-side prepared statement.
+
+        The statement is prepared once per connection and its cursor kept,
+        so later calls only send the parameters (binary, no escaping) and
+        the server skips parsing. Returns the cursor; read its results with
+        fetchall() before the connection is used again.
+        """
+        entry = self.statements.pop(query, None)
+        if entry is None:
+            while len(self.statements) >= MAX_PREPARED_PER_CONNECTION:
+                _, (_, old) = self.statements.popitem(last=False)
+                old.close()
+            entry = (query, self._cnx.cursor(prepared=True))
+        self.statements[query] = entry
+        # The cursor only reuses its statement when handed the same string
+        # object it was prepared with.
+        query, cursor = entry
+        try:
+            cursor.execute(query, params)
+        except mysql.connector.Error:
+            del self.statements[query]
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+            raise
+        return cursor
+
+    def close(self):
+        pool, self._pool = self._pool, None
+        if pool is not None:  # Closing twice returns it once
+            pool._return(self)
+
+
+class ConnectionPool:
+    """A MySQL connection pool with overflow and blocking checkout.
+
+    mysql.connector's own pool raises as soon as its fixed number of
+    connections is in use. This one keeps `size` connections, opens up to
+    `max_overflow` extra ones under load, and otherwise makes get_connection()
+    wait up to `timeout` seconds for one to be returned before raising
+    PoolExhaustedError. Connections past `max_age` seconds are replaced on
+    checkout; with `pre_ping`, a reused connection is checked first and
+    replaced if the server has dropped it. With `read_only`, sessions are
+    opened read only and, with `statement_timeout_ms`, every statement on
+    them is stopped after that long.
+    """
+
+    def __init__(
+        self,
+        size=5,
+        max_overflow=5,
+        timeout=10.0,
+        max_age=3600,
+        pre_ping=True,
+        name="write",
+        read_only=False,
+        statement_timeout_ms=0,
+        **connect_args,
+    ):
+        self.name = name
+        self.read_only = read_only
+        self.statement_timeout_ms = statement_timeout_ms
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_age = max_age
+        self.pre_ping = pre_ping
+        self.connect_args = connect_args
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.idle = []  # Connections ready to hand out, most recent last
+        self.open = 0  # Idle plus checked out, including ones being opened
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+        self.exhausted = 0
+        self.created = 0
+        self.recycled = 0
+        self.stale = 0
+
+    @classmethod
+    def from_config(cls, name="write"):
+        if name == "read":
+            return cls(name=name, read_only=True, **DB_READ_POOL, **DB_READ_CONFIG)
+        return cls(name=name, **DB_POOL, **DB_CONFIG)
+
+    def _connect(self):
+        cnx = mysql.connector.connect(**self.connect_args)
         try:
-            connection_pool = mysql.connector.pooling.MySQLConnectionPool(**DB_CONFIG)
-            logger.info("Database connection pool created successfully.")
-        except Exception as e:
-            logger.error(f"Error creating connection pool: {e}")
-            raise  # Re-raise the exception if pool creation fails
-    return connection_pool
+            cursor = cnx.cursor()
+            if self.read_only:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            if self.statement_timeout_ms:
+                cursor.execute(
+                    "SET SESSION MAX_EXECUTION_TIME = %s", (self.statement_timeout_ms,)
+                )
+            cursor.close()
+        except mysql.connector.Error:
+            cnx.close()
+            raise
+        with self.lock:
+            self.created += 1
+        return PooledConnection(self, cnx)
+
+    def _discard(self, conn):
+        try:
+            conn._cnx.close()
+        except mysql.connector.Error:
+            pass
+
+    def get_connection(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self.available:
+            self.checkouts += 1
+            while not self.idle and self.open >= self.size + self.max_overflow:
+                if not waited:
+                    waited = True
+                    self.waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.exhausted += 1
+                    self._add_wait(time.monotonic() - started)
+                    raise PoolExhaustedError(
+                        f"No database connection free after {self.timeout}s "
+                        f"({self.open} open)."
+                    )
+                self.available.wait(remaining)
+            if waited:
+                self._add_wait(time.monotonic() - started)
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                self.open += 1  # Reserve the slot while connecting
+
+        if conn is not None:
+            if time.monotonic() - conn.created_at > self.max_age:
+                self._discard(conn)
+                with self.lock:
+                    self.recycled += 1
+                conn = None
+            elif self.pre_ping and not conn._cnx.is_connected():
+                self._discard(conn)
+                with self.lock:
+                    self.stale += 1
+                conn = None
+            else:
+                conn._pool = self
+                return conn
+        try:
+            return self._connect()
+        except Exception:
+            with self.available:
+                self.open -= 1
+                self.available.notify()
+            raise
+
+    def _add_wait(self, seconds):
+        self.wait_time += seconds
+        self.max_wait = max(self.max_wait, seconds)
+
+    def _return(self, conn):
+        try:
+            if conn._cnx.in_transaction:
+                conn._cnx.rollback()  # Don't leak an open transaction
+            keep = conn._cnx.is_connected()
+        except mysql.connector.Error:
+            keep = False
+        with self.available:
+            # Overflow connections are closed once the pool is full again.
+            if keep and len(self.idle) < self.size:
+                self.idle.append(conn)
+                conn = None
+            else:
+                self.open -= 1
+            self.available.notify()
+        if conn is not None:
+            self._discard(conn)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "host": self.connect_args.get("host"),
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self.open,
+                "idle": len(self.idle),
+                "in_use": self.open - len(self.idle),
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "wait_ms_total": round(self.wait_time * 1000, 1),
+                "max_wait_ms": round(self.max_wait * 1000, 1),
+                "exhausted": self.exhausted,
+                "created": self.created,
+                "recycled": self.recycled,
+                "stale": self.stale,
+            }
+
+
+_pools_lock = threading.Lock()
+
+
+def get_pool(name="write"):
+    """Initializes and returns the "write" or "read" connection pool.
+
+    "write" serves the recognition path, "read" the dashboard, reports and
+    chatbot (DB_READ_POOL, on the replica in DB_READ_HOST if set), so a slow
+    analytics query can never hold a connection recognition is waiting for.
+    """
+    with _pools_lock:
+        pool = connection_pools.get(name)
+        if pool is None:
+            pool = connection_pools[name] = ConnectionPool.from_config(name)
+            logger.info(
+                f"Database {name} pool created for {pool.connect_args.get('host')}."
+            )
+    return pool
+
+
+def get_connection(pool="write"):
+    """Gets a connection from a pool, waiting for one if all are in use."""
+    return get_pool(pool).get_connection()
+
 
+def get_pool_stats():
+    return {name: get_pool(name).get_stats() for name in ("write", "read")}
 
-def get_connection():
-    """Gets a connection from the pool."""
-    pool = get_pool()
-    return pool.get_connection()
 
+def execute_query(
+    query,
+    params=None,
+    fetch_one=False,
+    fetch_all=False,
+    commit=False,
+    prepared=False,
+    pool="write",
+):
+    """Executes a SQL query using a connection from the pool.
 
-def execute_query(query, params=None, fetch_one=False, fetch_all=False, commit=False):
-    """Executes a SQL query using a connection from the pool."""
+    With `prepared` (for queries run over and over), the query goes through
+    the connection's cached prepared statement instead of being re-sent and
+    re-parsed every time. Reads for the dashboard, reports and chatbot pass
+    `pool="read"`. Database errors are logged and return None, except
+    PoolExhaustedError, which is raised so callers see the backpressure
+    instead of an empty result.
+    """
     conn = None
     cursor = None
     try:
-        conn = get_connection()
+        conn = get_connection(pool)
+        if prepared and PREPARED_STATEMENTS:
+            return _execute_prepared(conn, query, params, fetch_one, fetch_all, commit)
         # Use dictionary cursor if fetching data, else standard
         cursor = conn.cursor(dictionary=(fetch_one or fetch_all))
         cursor.execute(query, params)
@@ -48,6 +312,9 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False, commit=F
 
         return None
 
+    except PoolExhaustedError as e:
+        logger.warning(f"{e} Pool {pool}: {get_pool(pool).get_stats()}")
+        raise
     except mysql.connector.Error as e:
         logger.error(f"Database error: {e}. Query: {query}, Params: {params}")
         return None
@@ -58,26 +325,315 @@ def execute_query(query, params=None, fetch_one=False, fetch_all=False, commit=F
             conn.close()  # Returns connection to the pool
 
 
-def insert_customer(unique_id, name, email, face_encoding, last_visited, visit_count):
-    query = """
-        INSERT INTO customers
-        (unique_id, name, email, face_encoding, last_visited, visit_count)
-        VALUES (%s, %s, %s, %s, %s, %s)
-    """
-    return execute_query(
-        query,
+def _execute_prepared(conn, query, params, fetch_one, fetch_all, commit):
+    cursor = conn.execute_prepared(query, params or ())
+    if commit:
+        conn.commit()
+        return cursor.lastrowid
+    # Always drain the result, so the cached cursor can run again.
+    columns = cursor.column_names
+    rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    if fetch_one:
+        return rows[0] if rows else None
+    if fetch_all:
+        return rows
+    return None
+
+
+CUSTOMER_INSERT = """
+    INSERT INTO customers
+    (unique_id, name, email, face_encoding, last_visited, visit_count)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+def insert_customer(
+    unique_id, name, email, face_encoding, last_visited, visit_count, camera_id=None
+):
+    row_id = execute_query(
+        CUSTOMER_INSERT,
         (unique_id, name, email, face_encoding, last_visited, visit_count),
         commit=True,
+        prepared=True,
     )
+    if row_id is not None and last_visited is not None:
+        # Keep the enrolling sighting in the visit history too.
+        record_visit(unique_id, camera_id, None, last_visited, enrolled=True)
+    return row_id
 
 
-def update_customer_visit(unique_id):
-    query = """
-        UPDATE customers
-        SET last_visited = NOW(), visit_count = visit_count + 1
-        WHERE unique_id = %s
+def update_customer_visit(unique_id, camera_id=None, distance=None, visited_at=None):
+    """Records a visit of an existing customer as a `visits` event."""
+    return record_visit(unique_id, camera_id, distance, visited_at)
+
+
+def record_visit(
+    unique_id, camera_id=None, distance=None, visited_at=None, enrolled=False
+):
+    """Appends a visit event, through the queue when it is enabled.
+
+    `enrolled` marks the sighting that created the customer; it is kept for
+    history but not counted again, since insert_customer already set
+    visit_count to 1.
     """
-    return execute_query(query, (str(unique_id),), commit=True)
+    event = (
+        str(unique_id),
+        None if camera_id is None else str(camera_id),
+        visited_at or datetime.datetime.now(),
+        None if distance is None else float(distance),
+        bool(enrolled),
+    )
+    if visit_log.add(event):
+        return None
+    return visit_log.write_now(event)
+
+
+VISIT_INSERT = """
+    INSERT INTO visits
+    (customer_id, camera_id, visited_at, distance, enrolled)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+class VisitLog:
+    """Append-only visit events, inserted in bulk; customer counters follow.
+
+    Every sighting becomes a row of the `visits` table (customer, camera,
+    time, match distance), so recognition never locks a customer row. The
+    events are queued in memory and a background thread inserts them every
+    `flush_interval` seconds, one multi-row INSERT per `batch_size` events.
+    At most `max_pending` events are held; beyond that (or with the queue
+    disabled) events are inserted synchronously.
+
+    The same thread rolls visit_count and last_visited on `customers` forward
+    from the events, `rollup_batch` events per joined UPDATE. Each event is
+    flagged `rolled_up` in the transaction that applies it. Events are
+    claimed with FOR UPDATE SKIP LOCKED (MySQL 8.0+), so an insert that has
+    not committed yet is simply left for a later round, however late it
+    commits, and any number of processes can share the work without
+    applying an event twice. Counters trail the events by about an interval.
+    """
+
+    def __init__(
+        self,
+        enabled=True,
+        flush_interval=1.0,
+        max_pending=10000,
+        batch_size=500,
+        rollup_batch=5000,
+    ):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.rollup_batch = rollup_batch
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush or roll-up at a time
+        self.wake = threading.Event()
+        self.pending = []
+        self.thread = None
+        self.running = False
+        self.events_queued = 0
+        self.events_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.overflows = 0
+        self.last_flush_ms = None
+        self.max_flush_ms = 0.0
+        self.rollups = 0
+        self.failed_rollups = 0
+        self.events_rolled_up = 0
+
+    def add(self, event):
+        """Queues an event. Returns False if it has to be written synchronously."""
+        with self.lock:
+            if not self.running:
+                self._start()
+            if not self.enabled:
+                return False
+            if len(self.pending) >= self.max_pending:
+                self.overflows += 1
+                return False
+            self.pending.append(event)
+            self.events_queued += 1
+        return True
+
+    def _start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="visit-log", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _run(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+            self.rollup()
+
+    def _insert(self, events):
+        conn = get_connection()
+        cursor = conn.cursor()
+        try:
+            # mysql.connector sends this as a single multi-row INSERT.
+            cursor.executemany(VISIT_INSERT, events)
+            conn.commit()
+        finally:
+            cursor.close()
+            conn.close()
+
+    def write_now(self, event):
+        if execute_query(VISIT_INSERT, event, commit=True, prepared=True) is None:
+            return None  # Logged by execute_query
+        with self.lock:
+            self.events_written += 1
+        return True
+
+    def flush(self):
+        """Inserts all queued events. Returns the number written."""
+        with self.flush_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return 0
+
+            started = time.perf_counter()
+            written = 0
+            try:
+                for i in range(0, len(pending), self.batch_size):
+                    self._insert(pending[i : i + self.batch_size])
+                    written += len(pending[i : i + self.batch_size])
+            except Exception as e:
+                logger.error(f"Error flushing visit events: {e}")
+                self._requeue(pending[written:])
+                with self.lock:
+                    self.failed_flushes += 1
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.flushes += 1
+                self.events_written += written
+                self.last_flush_ms = elapsed_ms
+                self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            return written
+
+    def _requeue(self, events):
+        """Puts unwritten events back in front of any queued since."""
+        with self.lock:
+            room = max(0, self.max_pending - len(self.pending))
+            if len(events) > room:
+                self.overflows += len(events) - room
+                logger.warning(f"Dropping {len(events) - room} visit event(s).")
+            self.pending = events[:room] + self.pending
+
+    def rollup(self):
+        """Applies new committed events to the customer counters.
+
+        Returns the number of events applied.
+        """
+        applied = 0
+        while True:
+            claimed = self._rollup_batch()
+            applied += claimed
+            if claimed < self.rollup_batch:
+                return applied
+
+    def _rollup_batch(self):
+        with self.flush_lock:
+            conn = get_connection()
+            cursor = conn.cursor()
+            try:
+                # Rows of uncommitted inserts are locked, so they are skipped
+                # here and stay unflagged until a later round.
+                cursor.execute(
+                    "SELECT id FROM visits WHERE rolled_up = FALSE "
+                    "ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (self.rollup_batch,),
+                )
+                ids = [row[0] for row in cursor.fetchall()]
+                if not ids:
+                    conn.rollback()
+                    return 0
+                marks = ", ".join(["%s"] * len(ids))
+                cursor.execute(
+                    f"""
+                    UPDATE customers c
+                    JOIN (
+                        SELECT customer_id,
+                               SUM(NOT enrolled) AS visits,
+                               MAX(visited_at) AS last_seen
+                        FROM visits
+                        WHERE id IN ({marks})
+                        GROUP BY customer_id
+                    ) v ON c.unique_id = v.customer_id
+                    SET c.visit_count = c.visit_count + v.visits,
+                        c.last_visited = GREATEST(
+                            COALESCE(c.last_visited, v.last_seen), v.last_seen
+                        )
+                    """,
+                    ids,
+                )
+                cursor.execute(
+                    f"UPDATE visits SET rolled_up = TRUE WHERE id IN ({marks})", ids
+                )
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Error rolling visit events up into customers: {e}")
+                conn.rollback()
+                with self.lock:
+                    self.failed_rollups += 1
+                return 0
+            finally:
+                cursor.close()
+                conn.close()
+            with self.lock:
+                self.rollups += 1
+                self.events_rolled_up += len(ids)
+            return len(ids)
+
+    def close(self):
+        """Stops the background thread, inserts whatever is still queued and
+        rolls the events up, so the counters are current when a process exits.
+        """
+        self.running = False
+        self.wake.set()
+        started = self.thread is not None
+        if started:
+            self.thread.join(timeout=5)
+            self.thread = None
+        self.flush()
+        if started:
+            self.rollup()
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "queue_depth": len(self.pending),
+                "max_pending": self.max_pending,
+                "events_queued": self.events_queued,
+                "events_written": self.events_written,
+                "flushes": self.flushes,
+                "failed_flushes": self.failed_flushes,
+                "overflows": self.overflows,
+                "last_flush_ms": (
+                    round(self.last_flush_ms, 2)
+                    if self.last_flush_ms is not None
+                    else None
+                ),
+                "max_flush_ms": round(self.max_flush_ms, 2),
+                "rollups": self.rollups,
+                "failed_rollups": self.failed_rollups,
+                "events_rolled_up": self.events_rolled_up,
+            }
+
+
+visit_log = VisitLog(
+    VISIT_QUEUE["enabled"], VISIT_QUEUE["flush_interval"], VISIT_QUEUE["max_pending"]
+)
+
+
+def get_visit_queue_stats():
+    return visit_log.get_stats()
 
 
 def fetch_all_customers_for_rec():
@@ -86,9 +642,83 @@ def fetch_all_customers_for_rec():
     return execute_query(query, fetch_all=True)
 
 
+ENCODING_COUNT = "SELECT COUNT(*) FROM customers WHERE face_encoding IS NOT NULL"
+ENCODING_SCAN = (
+    "SELECT id, unique_id, face_encoding FROM customers "
+    "WHERE face_encoding IS NOT NULL ORDER BY id"
+)
+
+
+def read_encoding_matrix(cursor, expected, chunk_size=1000, dim=128):
+    """Decodes the rows of ENCODING_SCAN on `cursor` into a float32 matrix.
+
+    Rows are fetched `chunk_size` at a time and written into a matrix
+    preallocated for `expected` rows (grown if more turn up). Returns
+    (unique_ids, matrix); rows with a malformed encoding are skipped.
+    """
+    matrix = np.empty((expected, dim), dtype=np.float32)
+    unique_ids = []
+    skipped = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        valid = []
+        for row in rows:
+            if len(row[2]) == dim * 8:
+                valid.append(row)
+            else:
+                skipped += 1
+                logger.warning(f"Skipping malformed encoding of customer {row[0]}.")
+        if not valid:
+            continue
+        start, end = len(unique_ids), len(unique_ids) + len(valid)
+        if end > len(matrix):  # Customers added since the count
+            grown = np.empty((end + chunk_size, dim), dtype=np.float32)
+            grown[:start] = matrix[:start]
+            matrix = grown
+        matrix[start:end] = np.frombuffer(
+            b"".join(row[2] for row in valid), dtype=np.float64
+        ).reshape(-1, dim)
+        unique_ids.extend(row[1] for row in valid)
+
+    logger.info(
+        f"Loaded {len(unique_ids)} encodings ({skipped} skipped, "
+        f"{matrix.nbytes / 1e6:.1f} MB)."
+    )
+    return unique_ids, matrix[: len(unique_ids)]
+
+
+def fetch_encoding_matrix(chunk_size=1000, dim=128):
+    """Streams every stored face encoding into one float32 matrix.
+
+    Returns (unique_ids, matrix) with row i of the matrix belonging to
+    unique_ids[i]. Only the columns recognition needs are selected, through
+    an unbuffered cursor, and rows are decoded `chunk_size` at a time into a
+    matrix preallocated from a COUNT(*), so the peak memory of a refresh is
+    about the size of the matrix itself. Database errors are raised, so the
+    caller can keep its old data.
+    """
+    conn = get_connection()
+    cursor = None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(ENCODING_COUNT)
+        (expected,) = cursor.fetchone()
+        cursor.close()
+        # Unbuffered: rows stay on the socket until fetchmany() asks for them.
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(ENCODING_SCAN)
+        return read_encoding_matrix(cursor, expected, chunk_size, dim)
+    finally:
+        if cursor:
+            cursor.close()
+        conn.close()
+
+
 def fetch_schema():
     """Fetch the schema of all tables in the database."""
-    conn = get_connection()
+    conn = get_connection("read")
     cursor = conn.cursor()
     schema_str = ""
     try:
@@ -108,21 +738,99 @@ def fetch_schema():
     return schema_str
 
 
-def run_query(sql_query):
-    """Runs a given SQL query (potentially from LLM) and fetches all results."""
-    # Note: Using fetch_all=True implies a dictionary cursor.
-    # LLM queries might return different structures, so raw tuples might be safer
-    # or adjust this based on expected LLM output.
-    conn = get_connection()
-    cursor = conn.cursor()  # Using standard tuple cursor here.
-    results = None
+def fetch_schema_version():
+    """A fingerprint of every table and column in the database, in one query.
+
+    Any CREATE/DROP/ALTER TABLE that adds, drops, renames or retypes a column
+    changes it.
+    """
+    query = """
+        SELECT COUNT(*) as columns_count,
+               COALESCE(SUM(CRC32(CONCAT_WS(',', TABLE_NAME, COLUMN_NAME,
+                                            COLUMN_TYPE, ORDINAL_POSITION))), 0)
+                   as checksum
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+    """
+    result = execute_query(query, fetch_one=True, prepared=True, pool="read")
+    if result is None:
+        return None
+    return (int(result["columns_count"]), int(result["checksum"]))
+
+
+BLOB_TYPES = ("blob", "tinyblob", "mediumblob", "longblob", "binary", "varbinary")
+
+
+def fetch_table_columns():
+    """{table: [(column, is_blob)]} for every table, in column order."""
+    query = """
+        SELECT TABLE_NAME as table_name, COLUMN_NAME as column_name,
+               DATA_TYPE as data_type
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+        ORDER BY TABLE_NAME, ORDINAL_POSITION
+    """
+    columns = {}
+    for row in execute_query(query, fetch_all=True, pool="read") or []:
+        data_type = row["data_type"]
+        if isinstance(data_type, (bytes, bytearray)):
+            data_type = data_type.decode()
+        columns.setdefault(row["table_name"], []).append(
+            (row["column_name"], data_type.lower() in BLOB_TYPES)
+        )
+    return columns
+
+
+def _check_plan(cursor, sql, max_scan_rows):
+    """Raises QueryRejected if EXPLAIN shows a full scan of too many rows."""
+    cursor.execute(f"EXPLAIN {sql}")
+    names = [name.lower() for name in cursor.column_names]
+    for row in cursor.fetchall():
+        plan = dict(zip(names, row))
+        rows = int(plan.get("rows") or 0)
+        if plan.get("type") == "ALL" and rows > max_scan_rows:
+            raise QueryRejected(
+                f"That question would need a full scan of about {rows} rows of "
+                f"`{plan.get('table')}`. Please narrow it down, e.g. to a date range."
+            )
+
+
+def run_query(sql_query, columns=None):
+    """Runs chatbot SQL (potentially from LLM) within CHAT_QUERY_LIMITS.
+
+    The query must be a single SELECT; query_guard.prepare() caps its LIMIT
+    and expands `SELECT *` without blob columns (`columns` is
+    fetch_table_columns()). It runs with a MAX_EXECUTION_TIME and is refused
+    if its plan scans a whole table of more than `max_scan_rows` estimated
+    rows. Returns a QueryResult of tuples, flagged if it was cut short. It
+    runs on the read pool, so it never takes a recognition connection.
+    """
+    limits = CHAT_QUERY_LIMITS
+    sql = query_guard.prepare(sql_query, columns)
+    pool = get_pool("read")
+    conn = pool.get_connection()
     try:
-        cursor.execute(sql_query)
-        results = cursor.fetchall()
-    except mysql.connector.Error as e:
-        logger.error(f"Error running LLM query: {e}. Query: {sql_query}")
-        raise  # Re-raise to be handled in utils.py
+        cursor = conn.cursor()  # Using standard tuple cursor here.
+        try:
+            cursor.execute(
+                "SET SESSION MAX_EXECUTION_TIME = %s", (limits["timeout_ms"],)
+            )
+            if limits["max_scan_rows"]:
+                _check_plan(cursor, sql, limits["max_scan_rows"])
+            cursor.execute(sql)
+            return query_guard.collect(cursor, sql)
+        except mysql.connector.Error as e:
+            logger.error(f"Error running LLM query: {e}. Query: {sql}")
+            raise  # Re-raise to be handled in utils.py
+        finally:
+            try:
+                # The connection goes back to the pool with the pool's own limit.
+                cursor.execute(
+                    "SET SESSION MAX_EXECUTION_TIME = %s", (pool.statement_timeout_ms,)
+                )
+                cursor.close()
+            except mysql.connector.Error as e:
+                logger.warning(f"Could not reset the chat query cursor: {e}")
     finally:
-        cursor.close()
+        # Always back to the pool, even if the cursor could not be cleaned up.
         conn.close()
-    return results
@@ -0,0 +1,174 @@
+import threading
+from collections import deque
+import cv2
+import numpy as np
+from config import ADAPTIVE_DETECTION
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (resize factor, HOG upsample count), cheapest first. A face of s pixels is
+# seen by the detector at s * factor * 2**upsample pixels. The last level is
+# face_recognition's default (full size, upsampled once) and never exceeded.
+LEVELS = ((0.25, 0), (0.5, 0), (1.0, 0), (1.0, 1))
+BASELINE_LEVEL = len(LEVELS) - 1
+
+
+def _effective_scale(level):
+    factor, upsample = LEVELS[level]
+    return factor * 2**upsample
+
+
+class AdaptiveDetectionScale:
+    """Picks the cheapest detection scale for one camera from observed face sizes.
+
+    HOG cost grows with the square of the scale, and face_recognition's
+    default (upsample once) quadruples it even when the faces at a counter
+    are large. This keeps a window of recent face heights and uses the
+    smallest level at which the `percentile`-th smallest face would still
+    be `margin` times bigger than the detector's `min_detectable` pixels.
+
+    Every `probe_interval` frames one frame is detected at the baseline
+    level. If the probe finds a face the active level could not have seen,
+    or probes keep finding more faces than the active level did on the frame
+    just before, it steps back up.
+    """
+
+    def __init__(
+        self,
+        name=None,
+        enabled=True,
+        min_detectable=80,
+        margin=1.25,
+        percentile=10,
+        window=200,
+        min_samples=20,
+        probe_interval=30,
+    ):
+        self.name = name
+        self.enabled = enabled
+        self.min_detectable = min_detectable
+        self.margin = margin
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.probe_interval = max(2, probe_interval)
+        self.lock = threading.Lock()
+        self.level = BASELINE_LEVEL
+        self.sizes = deque(maxlen=window)
+        self.frames = 0
+        self.probes = 0
+        self.fallbacks = 0
+        self.changes = 0
+        self.hold_until = 0  # No stepping down before this frame
+        self.last_active_faces = None
+        # Running share of faces that probes found but the active level had not.
+        self.miss_rate = 0.0
+
+    @classmethod
+    def from_config(cls, name=None):
+        return cls(name=name, **ADAPTIVE_DETECTION)
+
+    def next_level(self):
+        """Returns the level to detect the next frame at."""
+        with self.lock:
+            self.frames += 1
+            if not self.enabled:
+                return BASELINE_LEVEL
+            if self.level < BASELINE_LEVEL and self.frames % self.probe_interval == 0:
+                self.probes += 1
+                return BASELINE_LEVEL
+            return self.level
+
+    def detect(self, detect, image, level, buffers=None):
+        """Runs `detect(image, upsample)` at `level`, in `image` coordinates."""
+        factor, upsample = LEVELS[level]
+        if factor == 1.0:
+            return detect(image, upsample)
+
+        height, width = image.shape[:2]
+        size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        small = buffers.acquire((size[1], size[0], 3)) if buffers else None
+        small = cv2.resize(image, size, dst=small, interpolation=cv2.INTER_AREA)
+        try:
+            found = detect(small, upsample)
+        finally:
+            if buffers is not None:
+                buffers.release(small)
+        return [tuple(int(round(v / factor)) for v in location) for location in found]
+
+    def _set_level(self, level, reason):
+        if level > self.level:
+            # Let the window catch up with what made us step up, otherwise
+            # the next frame would step straight back down.
+            self.hold_until = self.frames + 5 * self.probe_interval
+        if level != self.level:
+            logger.info(
+                f"[{self.name}] Detection level {LEVELS[self.level]} -> "
+                f"{LEVELS[level]} ({reason})."
+            )
+            self.level = level
+            self.changes += 1
+
+    def _covering_level(self, face_size):
+        """Cheapest level at which a face of `face_size` pixels is detectable."""
+        needed = self.min_detectable * self.margin / max(face_size, 1)
+        for level in range(len(LEVELS)):
+            if _effective_scale(level) >= needed:
+                return level
+        return BASELINE_LEVEL
+
+    def observe(self, face_locations, level):
+        """Learns from the faces detected in a frame detected at `level`."""
+        if not self.enabled:
+            return
+        sizes = [bottom - top for top, right, bottom, left in face_locations]
+        with self.lock:
+            self.sizes.extend(sizes)
+            if level == BASELINE_LEVEL and self.level < BASELINE_LEVEL:  # Probe
+                if self.last_active_faces is not None:
+                    missed = max(0, len(sizes) - self.last_active_faces)
+                    self.miss_rate = 0.7 * self.miss_rate + 0.3 * (
+                        missed / max(1, len(sizes))
+                    )
+                if sizes and self._covering_level(min(sizes)) > self.level:
+                    self.fallbacks += 1
+                    self._set_level(
+                        self._covering_level(min(sizes)), "probe found smaller faces"
+                    )
+                    return
+                if self.miss_rate > 0.3:
+                    self.fallbacks += 1
+                    self.miss_rate = 0.0
+                    self._set_level(self.level + 1, "probes found missed faces")
+                    return
+            elif level == self.level:
+                self.last_active_faces = len(sizes)
+
+            if len(self.sizes) >= self.min_samples:
+                face_size = np.percentile(self.sizes, self.percentile)
+                target = self._covering_level(face_size)
+                # Step down one level at a time; steps up come from the checks
+                # above or from smaller faces showing up in the window.
+                if target < self.level and self.frames >= self.hold_until:
+                    self._set_level(self.level - 1, f"faces ~{face_size:.0f}px")
+                elif target > self.level:
+                    self._set_level(target, f"faces ~{face_size:.0f}px")
+
+    def get_stats(self):
+        with self.lock:
+            factor, upsample = LEVELS[self.level]
+            return {
+                "enabled": self.enabled,
+                "scale": factor,
+                "upsample": upsample,
+                "small_face_px": (
+                    round(float(np.percentile(self.sizes, self.percentile)), 1)
+                    if self.sizes
+                    else None
+                ),
+                "frames": self.frames,
+                "probes": self.probes,
+                "miss_rate": round(self.miss_rate, 3),
+                "fallbacks": self.fallbacks,
+                "changes": self.changes,
+            }
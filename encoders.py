@@ -0,0 +1,321 @@
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import dlib
+import face_recognition
+import face_recognition_models
+from config import (
+    ENCODING_BACKEND,
+    ENCODING_WORKERS,
+    ENCODING_POOL_DETECT,
+    LANDMARK_MODEL,
+    NUM_JITTERS,
+    PREDICTOR_PATH,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Workers only attach to blocks the parent owns; keep them from being tracked
+# (and unlinked) a second time where Python supports it.
+_ATTACH_KWARGS = {"track": False} if sys.version_info >= (3, 13) else {}
+
+
+LANDMARK_MODELS = ("small", "large")
+
+
+def _check_landmark_model(landmark_model):
+    if landmark_model not in LANDMARK_MODELS:
+        raise ValueError(f"Unknown landmark model: {landmark_model}")
+    return landmark_model
+
+
+class InlineEncoder:
+    """Detects and encodes faces in the calling thread."""
+
+    name = "inline"
+
+    def __init__(self, landmark_model=None, num_jitters=None):
+        self.landmark_model = _check_landmark_model(landmark_model or LANDMARK_MODEL)
+        self.num_jitters = num_jitters or NUM_JITTERS
+
+    def detect(self, rgb_frame, upsample=1):
+        return face_recognition.face_locations(
+            rgb_frame, number_of_times_to_upsample=upsample
+        )
+
+    def encode(self, rgb_frame, face_locations):
+        if not face_locations:
+            return []
+        return face_recognition.face_encodings(
+            rgb_frame,
+            face_locations,
+            num_jitters=self.num_jitters,
+            model=self.landmark_model,
+        )
+
+    def close(self):
+        pass
+
+    def get_stats(self):
+        return {
+            "backend": self.name,
+            "landmark_model": self.landmark_model,
+            "num_jitters": self.num_jitters,
+        }
+
+
+class ChipBatchEncoder(InlineEncoder):
+    """Aligns faces into 150x150 chips and encodes them in one batched dlib call.
+
+    face_recognition runs the descriptor network once per face; here all
+    faces of a frame (or of several frames, via encode_batch) go through it
+    together. Chips are cut with the same landmarks and 0.25 padding
+    face_recognition uses, so the encodings are interchangeable.
+    """
+
+    name = "chips"
+    CHIP_SIZE = 150
+    CHIP_PADDING = 0.25
+
+    def __init__(self, landmark_model=None, num_jitters=None):
+        super().__init__(landmark_model, num_jitters)
+        if self.landmark_model == "small":
+            predictor_path = (
+                face_recognition_models.pose_predictor_five_point_model_location()
+            )
+        else:
+            predictor_path = PREDICTOR_PATH
+        self.shape_predictor = dlib.shape_predictor(predictor_path)
+        self.face_encoder = dlib.face_recognition_model_v1(
+            face_recognition_models.face_recognition_model_location()
+        )
+        self.batches = 0
+        self.faces_encoded = 0
+
+    def encode(self, rgb_frame, face_locations):
+        return self.encode_batch([(rgb_frame, face_locations)])[0]
+
+    def encode_batch(self, items):
+        """Encodes a list of (rgb_frame, face_locations) in one network pass.
+
+        Returns one list of encodings per item, in the same order.
+        """
+        chips = []
+        counts = []
+        for rgb_frame, face_locations in items:
+            shapes = dlib.full_object_detections()
+            for top, right, bottom, left in face_locations:
+                rect = dlib.rectangle(left, top, right, bottom)
+                shapes.append(self.shape_predictor(rgb_frame, rect))
+            if len(shapes):
+                chips.extend(
+                    dlib.get_face_chips(
+                        rgb_frame,
+                        shapes,
+                        size=self.CHIP_SIZE,
+                        padding=self.CHIP_PADDING,
+                    )
+                )
+            counts.append(len(face_locations))
+
+        descriptors = []
+        if chips:
+            descriptors = self.face_encoder.compute_face_descriptor(
+                chips, self.num_jitters
+            )
+        self.batches += 1
+        self.faces_encoded += len(chips)
+
+        results = []
+        offset = 0
+        for count in counts:
+            results.append([np.array(d) for d in descriptors[offset : offset + count]])
+            offset += count
+        return results
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update(batches=self.batches, faces_encoded=self.faces_encoded)
+        return stats
+
+
+# --- Process pool backend ---
+_worker_fr = None
+
+
+def _init_worker():
+    # Importing face_recognition loads dlib's detector, landmark and
+    # descriptor models, so this happens once per worker process.
+    global _worker_fr
+    import face_recognition as fr
+
+    _worker_fr = fr
+
+
+def _attach_frame(shm_name, shape, dtype):
+    if _ATTACH_KWARGS:
+        shm = shared_memory.SharedMemory(name=shm_name, **_ATTACH_KWARGS)
+    else:
+        # Attaching registers the block with the resource tracker as if this
+        # worker owned it. Unregistering afterwards is no better: workers
+        # share the parent's tracker, whose own entry would go with it. So
+        # the registration is skipped; pool workers run one task at a time.
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+        finally:
+            resource_tracker.register = register
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _detect_in_worker(shm_name, shape, dtype, upsample):
+    shm, frame = _attach_frame(shm_name, shape, dtype)
+    try:
+        return _worker_fr.face_locations(frame, number_of_times_to_upsample=upsample)
+    finally:
+        del frame  # Release the view before closing the mapping
+        shm.close()
+
+
+def _encode_in_worker(
+    shm_name, shape, dtype, face_locations, landmark_model, num_jitters
+):
+    shm, frame = _attach_frame(shm_name, shape, dtype)
+    try:
+        return _worker_fr.face_encodings(
+            frame, face_locations, num_jitters=num_jitters, model=landmark_model
+        )
+    finally:
+        del frame
+        shm.close()
+
+
+class ProcessPoolEncoder:
+    """Fans face encoding (and optionally detection) out to worker processes.
+
+    Each frame is copied once into a shared memory block; workers attach to
+    it by name and read their face region from there, so only the block
+    name, frame shape and face boxes are pickled per task. The faces of one
+    frame are encoded in parallel, one task per face.
+    """
+
+    name = "process"
+
+    def __init__(
+        self,
+        workers=None,
+        detect_in_pool=False,
+        start_method="spawn",
+        landmark_model=None,
+        num_jitters=None,
+    ):
+        self.landmark_model = _check_landmark_model(landmark_model or LANDMARK_MODEL)
+        self.num_jitters = num_jitters or NUM_JITTERS
+        self.workers = workers or os.cpu_count() or 1
+        self.detect_in_pool = detect_in_pool
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_worker,
+        )
+        self.faces_encoded = 0
+        self.frames_detected = 0
+        logger.info(
+            f"Encoding process pool created with {self.workers} workers "
+            f"(detection in pool: {detect_in_pool})."
+        )
+
+    def _share_frame(self, rgb_frame):
+        shm = shared_memory.SharedMemory(create=True, size=rgb_frame.nbytes)
+        view = np.ndarray(rgb_frame.shape, dtype=rgb_frame.dtype, buffer=shm.buf)
+        view[:] = rgb_frame
+        del view
+        return shm
+
+    def detect(self, rgb_frame, upsample=1):
+        if not self.detect_in_pool:
+            return face_recognition.face_locations(
+                rgb_frame, number_of_times_to_upsample=upsample
+            )
+        shm = self._share_frame(rgb_frame)
+        try:
+            future = self.executor.submit(
+                _detect_in_worker,
+                shm.name,
+                rgb_frame.shape,
+                rgb_frame.dtype.str,
+                upsample,
+            )
+            face_locations = future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        self.frames_detected += 1
+        return face_locations
+
+    def encode(self, rgb_frame, face_locations):
+        if not face_locations:
+            return []
+        shm = self._share_frame(rgb_frame)
+        try:
+            futures = [
+                self.executor.submit(
+                    _encode_in_worker,
+                    shm.name,
+                    rgb_frame.shape,
+                    rgb_frame.dtype.str,
+                    [location],
+                    self.landmark_model,
+                    self.num_jitters,
+                )
+                for location in face_locations
+            ]
+            encodings = [future.result()[0] for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+        self.faces_encoded += len(encodings)
+        return encodings
+
+    def close(self):
+        if sys.version_info >= (3, 9):
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        else:  # cancel_futures is new in 3.9; queued faces then still run
+            self.executor.shutdown(wait=True)
+        logger.info("Encoding process pool shut down.")
+
+    def get_stats(self):
+        return {
+            "backend": self.name,
+            "landmark_model": self.landmark_model,
+            "num_jitters": self.num_jitters,
+            "workers": self.workers,
+            "detect_in_pool": self.detect_in_pool,
+            "frames_detected": self.frames_detected,
+            "faces_encoded": self.faces_encoded,
+        }
+
+
+def create_encoder(backend=None, landmark_model=None, num_jitters=None):
+    """Returns the encoder for `backend` ("inline", "chips" or "process").
+
+    Landmark model and jitter count default to LANDMARK_MODEL / NUM_JITTERS.
+    """
+    backend = backend or ENCODING_BACKEND
+    if backend == "inline":
+        return InlineEncoder(landmark_model, num_jitters)
+    if backend == "chips":
+        return ChipBatchEncoder(landmark_model, num_jitters)
+    if backend == "process":
+        return ProcessPoolEncoder(
+            ENCODING_WORKERS,
+            detect_in_pool=ENCODING_POOL_DETECT,
+            landmark_model=landmark_model,
+            num_jitters=num_jitters,
+        )
+    raise ValueError(f"Unknown encoding backend: {backend}")
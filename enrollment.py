@@ -0,0 +1,113 @@
+import threading
+import time
+import numpy as np
+from config import ENROLLMENT_CONFIG
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingTrack:
+    def __init__(self, encoding, now):
+        self.sum = np.array(encoding, dtype=np.float64)
+        self.count = 1
+        self.first_seen = now
+        self.last_seen = now
+
+    @property
+    def mean(self):
+        return self.sum / self.count
+
+    def add(self, encoding, now):
+        self.sum += encoding
+        self.count += 1
+        self.last_seen = now
+
+
+class PendingEnrollmentBuffer:
+    """Holds unmatched encodings until the same face has been seen consistently.
+
+    Unknown encodings are grouped into tracks by distance to each track's
+    running mean. A track is confirmed once it has at least `min_frames`
+    sightings spanning at least `min_seconds`; its averaged encoding is then
+    handed back for enrollment. Tracks not seen for `max_gap` seconds expire,
+    so a single bad frame never becomes a customer.
+    """
+
+    def __init__(
+        self,
+        min_frames=3,
+        min_seconds=0.0,
+        max_gap=10.0,
+        tolerance=0.5,
+        max_pending=200,
+        timer=time.time,
+    ):
+        self.min_frames = max(1, min_frames)
+        self.min_seconds = min_seconds
+        self.max_gap = max_gap
+        self.tolerance = tolerance
+        self.max_pending = max_pending
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.tracks = []
+        self.confirmed = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_config(cls, timer=time.time):
+        return cls(timer=timer, **ENROLLMENT_CONFIG)
+
+    def _expire(self, now):
+        alive = [t for t in self.tracks if now - t.last_seen <= self.max_gap]
+        self.expired += len(self.tracks) - len(alive)
+        self.tracks = alive
+
+    def add(self, encoding):
+        """Adds an unmatched encoding.
+
+        Returns the averaged encoding if this sighting confirms its track,
+        otherwise None.
+        """
+        encoding = np.asarray(encoding, dtype=np.float64)
+        now = self.timer()
+        with self.lock:
+            self._expire(now)
+
+            track = None
+            if self.tracks:
+                means = np.array([t.mean for t in self.tracks])
+                distances = np.linalg.norm(means - encoding, axis=1)
+                nearest = int(np.argmin(distances))
+                if distances[nearest] <= self.tolerance:
+                    track = self.tracks[nearest]
+
+            if track is None:
+                if len(self.tracks) >= self.max_pending:
+                    oldest = min(self.tracks, key=lambda t: t.last_seen)
+                    self.tracks.remove(oldest)
+                    self.evicted += 1
+                track = _PendingTrack(encoding, now)
+                self.tracks.append(track)
+            else:
+                track.add(encoding, now)
+
+            if (
+                track.count >= self.min_frames
+                and track.last_seen - track.first_seen >= self.min_seconds
+            ):
+                self.tracks.remove(track)
+                self.confirmed += 1
+                logger.debug(f"Pending face confirmed after {track.count} sightings.")
+                return track.mean
+        return None
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "pending": len(self.tracks),
+                "confirmed": self.confirmed,
+                "expired": self.expired,
+                "evicted": self.evicted,
+            }
@@ -6,106 +6,119 @@ import datetime
 from cachetools import TTLCache
 import faiss
 from config import PREDICTOR_PATH
-from database import fetch_all_customers_for_rec, insert_customer, update_customer_visit
+from encoders import create_encoder
+from quality import FaceQualityGate
+from enrollment import PendingEnrollmentBuffer
+from storage import CustomerStore, get_store
 import os
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
 
 # --- FAISS functions ---
-def build_faiss_index(customers):
-    if not customers:
-        return None, []
-    valid_customers = [c for c in customers if c.get("face_encoding")]
-    if not valid_customers:
-        return None, []
+def encoding_matrix(customers):
+    """Stacks the customers' encodings into (unique_ids, float32 matrix).
 
-    encodings_list = [
-        np.frombuffer(c["face_encoding"], dtype=np.float64) for c in valid_customers
-    ]
-
-    # Ensure all encodings have the same dimension (128)
-    X_list = [enc for enc in encodings_list if enc.shape == (128,)]
-    if not X_list:
-        return None, []
+    Customers without a valid 128-d encoding are left out.
+    """
+    id_list, rows = [], []
+    for c in customers:
+        if not c.get("face_encoding"):
+            continue
+        encoding = np.frombuffer(c["face_encoding"], dtype=np.float64)
+        if encoding.shape == (128,):
+            id_list.append(c["unique_id"])
+            rows.append(encoding)
+    matrix = np.array(rows, dtype="float32").reshape(len(rows), 128)
+    return id_list, matrix
 
-    X = np.array(X_list).astype("float32")
 
-    if X.shape[0] == 0:
+def build_faiss_index(customers=None, id_list=None, matrix=None):
+    """Builds an IndexFlatL2 over `customers`, or over an encoding `matrix`."""
+    if matrix is None:
+        id_list, matrix = encoding_matrix(customers or [])
+    if not id_list:
         return None, []
-
-    index = faiss.IndexFlatL2(X.shape[1])
-    index.add(X)
-    # Map index back to customer unique_id for *valid* encodings
-    id_list = [
-        c["unique_id"]
-        for c, enc in zip(valid_customers, encodings_list)
-        if enc.shape == (128,)
-    ]
+    index = faiss.IndexFlatL2(matrix.shape[1])
+    index.add(np.ascontiguousarray(matrix, dtype="float32"))
+    # Row i of the index is customer id_list[i]
     return index, id_list
 
 
-def search_faiss_index(index, id_list, face_encoding, threshold=0.6):
+def search_faiss_index(
+    index, id_list, face_encoding, threshold=0.6, with_distance=False
+):
+    """Nearest known unique_id, or with `with_distance` (unique_id, distance)."""
+    no_match = (None, None) if with_distance else None
     if index is None or not id_list:
-        return None
+        return no_match
     face_encoding_np = np.array(face_encoding).astype("float32").reshape(1, -1)
     D, I = index.search(face_encoding_np, 1)
     if D.size > 0 and I.size > 0 and D[0][0] < threshold:
         idx = I[0][0]
         if 0 <= idx < len(id_list):
+            if with_distance:
+                # IndexFlatL2 reports squared distances.
+                return id_list[idx], float(np.sqrt(D[0][0]))
             return id_list[idx]
-    return None
+    return no_match
 
 
 # --- Face Recognition Core ---
 class FaceProcessor:
-    def __init__(self):
+    def __init__(self, encoder=None, store=None, quality_gate=None):
         if not os.path.exists(PREDICTOR_PATH):
             logger.error(f"Predictor file not found: {PREDICTOR_PATH}")
             raise FileNotFoundError(f"Predictor file not found: {PREDICTOR_PATH}")
-        self.customers = []
         self.faiss_index = None
         self.id_list = []
         self.known_encodings = []
         self.known_ids = []
         self.cache = TTLCache(maxsize=500, ttl=3600)  # 1 hour cache
+        # Guards the index/known lists swap and the cache, since pipeline
+        # stages call in from several threads. Held only for in-memory
+        # updates, never across a search or a database write.
+        self.lock = threading.RLock()
+        self.encoder = encoder or create_encoder()
+        self.quality_gate = quality_gate or FaceQualityGate.from_config()
+        self.pending = PendingEnrollmentBuffer.from_config()
+        # A storage.CustomerStore, or anything with its customer functions
+        # (the batch CLI passes an in-memory store for dry runs). Only a
+        # CustomerStore is asked to stream the encoding matrix.
+        self.store = store or get_store()
         self.refresh_data()
 
     def refresh_data(self):
         logger.info("Refreshing customer data for face recognition...")
         try:
-            self.customers = fetch_all_customers_for_rec()
-            if not self.customers:
+            if isinstance(self.store, CustomerStore):
+                # Streams the encodings straight into one float32 matrix.
+                id_list, matrix = self.store.fetch_encoding_matrix()
+            else:
+                customers = self.store.fetch_all_customers_for_rec() or []
+                id_list, matrix = encoding_matrix(customers)
+            if not id_list:
                 logger.warning("No customers found in DB or no encodings available.")
-                self.customers = []
-                self.faiss_index, self.id_list = None, []
-                self.known_encodings, self.known_ids = [], []
+                with self.lock:
+                    self.faiss_index, self.id_list = None, []
+                    self.known_encodings, self.known_ids = [], []
                 return
 
-            self.faiss_index, self.id_list = build_faiss_index(self.customers)
-
-            valid_customers = [c for c in self.customers if c.get("face_encoding")]
-            encodings_list = [
-                np.frombuffer(c["face_encoding"], dtype=np.float64)
-                for c in valid_customers
-            ]
+            faiss_index, id_list = build_faiss_index(id_list=id_list, matrix=matrix)
 
-            self.known_encodings = [
-                enc for enc in encodings_list if enc.shape == (128,)
-            ]
-            self.known_ids = [
-                c["unique_id"]
-                for c, enc in zip(valid_customers, encodings_list)
-                if enc.shape == (128,)
-            ]
+            with self.lock:
+                self.faiss_index, self.id_list = faiss_index, id_list
+                # The same rows serve the compare_faces fallback.
+                self.known_encodings, self.known_ids = matrix, id_list
 
-            logger.info(f"Data refreshed. {len(self.known_ids)} known faces loaded.")
+            logger.info(f"Data refreshed. {len(id_list)} known faces loaded.")
         except Exception as e:
             logger.error(f"Error refreshing face recognition data: {e}")
 
-    def process_frame(self, frame):
-        """Processes a single frame for faces and identifies/adds customers."""
+    def ensure_loaded(self):
+        """Returns True if known faces are loaded, refreshing once if not."""
         if not self.known_ids:
             logger.warning(
                 "No known faces loaded, attempting refresh before processing."
@@ -113,54 +126,172 @@ class FaceProcessor:
             self.refresh_data()
             if not self.known_ids:
                 logger.warning("Still no known faces after refresh, skipping frame.")
-                return []
+                return False
+        return True
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        # Use a smaller frame for faster detection (optional)
-        # small_frame = cv2.resize(rgb_frame, (0, 0), fx=0.5, fy=0.5)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+    def detect(self, frame, roi=None, buffers=None, scale=None):
+        """Converts a BGR frame to RGB and returns (rgb_frame, face_locations).
 
-        results = []
+        With a RegionOfInterest, only its regions are scanned; with an
+        AdaptiveDetectionScale, they are scanned at the camera's current
+        detection scale. Faces rejected by the quality gate are left out, so
+        they never reach the (expensive) encoder. With a FrameBufferPool, the
+        RGB frame is written into a pooled buffer that the caller releases.
+        """
+        if buffers is not None:
+            rgb_frame = buffers.acquire(frame.shape)
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb_frame)
+        else:
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        detect = self.encoder.detect
+        if scale is not None:
+            level = scale.next_level()
 
-        for encoding in face_encodings:
-            customer_id = None
-            is_new = False
-
-            # 1. Try FAISS
-            faiss_id = search_faiss_index(self.faiss_index, self.id_list, encoding)
-
-            if faiss_id:
-                customer_id = faiss_id
-            elif self.known_encodings:  # Only search if known_encodings exist
-                # 2. Try face_recognition.compare_faces
-                matches = face_recognition.compare_faces(
-                    self.known_encodings, encoding, tolerance=0.6
-                )
-                if True in matches:
-                    first_match_index = matches.index(True)
-                    customer_id = self.known_ids[first_match_index]
+            def detect(image):
+                return scale.detect(self.encoder.detect, image, level, buffers)
+
+        if roi is not None:
+            face_locations = roi.detect(detect, rgb_frame, buffers)
+        else:
+            face_locations = detect(rgb_frame)
+        if scale is not None:
+            scale.observe(face_locations, level)
+        face_locations = self.quality_gate.filter(rgb_frame, face_locations)
+        return rgb_frame, face_locations
+
+    def encode(self, rgb_frame, face_locations):
+        """Returns one 128-d encoding per face location."""
+        return self.encoder.encode(rgb_frame, face_locations)
+
+    def encode_batch(self, items):
+        """Encodes a list of (rgb_frame, face_locations), batched if supported."""
+        if hasattr(self.encoder, "encode_batch"):
+            return self.encoder.encode_batch(items)
+        return [self.encoder.encode(rgb, locations) for rgb, locations in items]
+
+    def close(self):
+        """Releases the encoder (and its worker processes, if any)."""
+        self.encoder.close()
+
+    def match(self, encoding):
+        """Returns the unique_id of the known customer matching `encoding`, or None."""
+        return self.match_with_distance(encoding)[0]
 
-            # 3. If still no match, it's a new customer
+    def match_with_distance(self, encoding):
+        """Returns (unique_id, face distance) of the match, or (None, None)."""
+        with self.lock:
+            faiss_index, id_list = self.faiss_index, self.id_list
+            known_encodings, known_ids = self.known_encodings, self.known_ids
+
+        # 1. Try FAISS
+        faiss_id, distance = search_faiss_index(
+            faiss_index, id_list, encoding, with_distance=True
+        )
+        if faiss_id:
+            return faiss_id, distance
+
+        if len(known_encodings):  # Only search if known_encodings exist
+            # 2. Try face_recognition.compare_faces
+            matches = face_recognition.compare_faces(
+                known_encodings, encoding, tolerance=0.6
+            )
+            if True in matches:
+                i = matches.index(True)
+                distance = np.linalg.norm(np.asarray(known_encodings[i]) - encoding)
+                return known_ids[i], float(distance)
+        return None, None
+
+    def _add_known(self, unique_id, encoding):
+        """Adds one enrolled face to the index without reloading every customer."""
+        vector = np.asarray(encoding, dtype="float32").reshape(1, -1)
+        with self.lock:
+            if self.faiss_index is None:
+                index = faiss.IndexFlatL2(vector.shape[1])
+            else:
+                # Copy-on-write: other threads may be searching the current one.
+                index = faiss.clone_index(self.faiss_index)
+            index.add(vector)
+            self.faiss_index = index
+            self.id_list = self.id_list + [unique_id]
+            if len(self.known_encodings):
+                self.known_encodings = np.vstack([self.known_encodings, vector])
+            else:
+                self.known_encodings = vector
+            self.known_ids = self.known_ids + [unique_id]
+
+    def record(
+        self, encoding, customer_id=None, camera_id=None, distance=None, visited_at=None
+    ):
+        """Persists a sighting of `encoding` matched to `customer_id`.
+
+        An unmatched encoding goes to the pending-enrollment buffer and is only
+        enrolled, with the averaged encoding, once the same face has been seen
+        consistently. The sighting is stored as taken at `visited_at` (default:
+        now), so recorded footage keeps its own timeline. Returns the result
+        dict for the sighting, or None if the customer was seen recently, the
+        face is still pending or it could not be stored.
+        """
+        is_new = False
+
+        # 3. If still no match, it may be a new customer. `customer_id` is the
+        # caller's match; the encoding is not searched again.
+        if not customer_id:
+            averaged = self.pending.add(encoding)  # Has its own lock
+            if averaged is None:
+                return None
+            # Once per confirmed track: the averaged face may match where
+            # single sightings did not, or a face enrolled meanwhile.
+            customer_id = self.match(averaged)
             if not customer_id:
                 unique_id = str(uuid.uuid4())
-                encoding_blob = encoding.tobytes()
-                insert_customer(
-                    unique_id, None, None, encoding_blob, datetime.datetime.now(), 1
+                row_id = self.store.insert_customer(
+                    unique_id,
+                    None,
+                    None,
+                    averaged.tobytes(),
+                    visited_at or datetime.datetime.now(),
+                    1,
+                    camera_id=camera_id,
                 )
+                if row_id is None:
+                    # Not indexed either, so later sightings cannot match a
+                    # customer with no row; the track re-forms and retries.
+                    logger.error(f"Could not store new customer {unique_id}.")
+                    return None
                 logger.info(f"New customer detected: {unique_id}")
                 customer_id = unique_id
                 is_new = True
-                self.refresh_data()  # Refresh data immediately after adding
-
-            # 4. Update visit / Cache Check
-            if customer_id and customer_id not in self.cache:
-                if not is_new:
-                    logger.info(f"Existing customer seen: {customer_id}")
-                    update_customer_visit(customer_id)
-                self.cache[customer_id] = True
-                results.append({"customer_id": customer_id, "new": is_new})
-            elif customer_id:
+                self._add_known(unique_id, averaged)  # Locks for the swap only
+
+        # 4. Update visit / Cache Check
+        with self.lock:
+            if customer_id in self.cache:
                 logger.debug(f"Customer in cache: {customer_id}")
+                return None
+            self.cache[customer_id] = True
 
+        if not is_new:
+            logger.info(f"Existing customer seen: {customer_id}")
+            self.store.update_customer_visit(
+                customer_id,
+                camera_id=camera_id,
+                distance=distance,
+                visited_at=visited_at,
+            )
+        return {"customer_id": customer_id, "new": is_new}
+
+    def process_frame(self, frame, roi=None):
+        """Processes a single frame for faces and identifies/adds customers."""
+        if not self.ensure_loaded():
+            return []
+
+        rgb_frame, face_locations = self.detect(frame, roi)
+        face_encodings = self.encode(rgb_frame, face_locations)
+
+        results = []
+        for encoding in face_encodings:
+            customer_id, distance = self.match_with_distance(encoding)
+            result = self.record(encoding, customer_id, distance=distance)
+            if result:
+                results.append(result)
         return results
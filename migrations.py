@@ -0,0 +1,275 @@
+"""Versioned schema migrations for the MySQL and SQLite backends.
+
+    python migrations.py status
+    python migrations.py up [--to VERSION]
+
+Each migration has a version number, a description and the statements for
+each backend. Applied versions are recorded in `schema_migrations`, so
+`up` only runs what is missing, in order. The first migrations create the
+tables with IF NOT EXISTS, so a database set up by hand from an older
+README is adopted as is. The SQLite store migrates itself when it opens
+its file, one migration at a time under the database's write lock, so
+processes starting together apply each one once; MySQL is migrated with
+the command above.
+"""
+
+import argparse
+import datetime
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = (
+    (
+        1,
+        "customers table",
+        {
+            "mysql": [
+                """
+                CREATE TABLE IF NOT EXISTS customers (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    unique_id VARCHAR(36) NOT NULL UNIQUE,
+                    name VARCHAR(255) NULL,
+                    email VARCHAR(255) NULL,
+                    face_encoding BLOB NOT NULL,
+                    last_visited TIMESTAMP NULL,
+                    visit_count INT DEFAULT 1,
+                    INDEX(unique_id)
+                )
+                """
+            ],
+            "sqlite": [
+                """
+                CREATE TABLE IF NOT EXISTS customers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    unique_id TEXT NOT NULL UNIQUE,
+                    name TEXT NULL,
+                    email TEXT NULL,
+                    face_encoding BLOB NOT NULL,
+                    last_visited TIMESTAMP NULL,
+                    visit_count INTEGER DEFAULT 1
+                )
+                """
+            ],
+        },
+    ),
+    (
+        2,
+        "visits event table",
+        {
+            "mysql": [
+                """
+                CREATE TABLE IF NOT EXISTS visits (
+                    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                    customer_id VARCHAR(36) NOT NULL,
+                    camera_id VARCHAR(64) NULL,
+                    visited_at TIMESTAMP(3) NOT NULL,
+                    distance FLOAT NULL,
+                    enrolled BOOLEAN NOT NULL DEFAULT FALSE,
+                    INDEX(visited_at),
+                    INDEX(customer_id, visited_at)
+                )
+                """,
+                """
+                CREATE TABLE IF NOT EXISTS visit_rollup (
+                    id TINYINT PRIMARY KEY,
+                    last_visit_id BIGINT NOT NULL
+                )
+                """,
+                "INSERT IGNORE INTO visit_rollup (id, last_visit_id) VALUES (1, 0)",
+            ],
+            "sqlite": [
+                """
+                CREATE TABLE IF NOT EXISTS visits (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    customer_id TEXT NOT NULL,
+                    camera_id TEXT NULL,
+                    visited_at TIMESTAMP NOT NULL,
+                    distance REAL NULL,
+                    enrolled INTEGER NOT NULL DEFAULT 0
+                )
+                """,
+                "CREATE INDEX IF NOT EXISTS visits_visited_at ON visits (visited_at)",
+                "CREATE INDEX IF NOT EXISTS visits_customer "
+                "ON visits (customer_id, visited_at)",
+            ],
+        },
+    ),
+    (
+        3,
+        "customer indexes for time-range and top-visitor queries",
+        {
+            # (visit_count, last_visited) serves ORDER BY visit_count and the
+            # `visit_count = 1 AND last_visited >= today` new-customer count.
+            "mysql": [
+                "CREATE INDEX idx_customers_last_visited ON customers (last_visited)",
+                "CREATE INDEX idx_customers_visit_count "
+                "ON customers (visit_count, last_visited)",
+            ],
+            "sqlite": [
+                "CREATE INDEX IF NOT EXISTS idx_customers_last_visited "
+                "ON customers (last_visited)",
+                "CREATE INDEX IF NOT EXISTS idx_customers_visit_count "
+                "ON customers (visit_count, last_visited)",
+            ],
+        },
+    ),
+    (
+        4,
+        "per-event roll-up flag on visits",
+        {
+            # Replaces visit_rollup's single high-water mark, which skipped
+            # events whose insert committed after a higher id was rolled up.
+            "mysql": [
+                "ALTER TABLE visits ADD COLUMN rolled_up BOOLEAN NOT NULL DEFAULT FALSE",
+                "UPDATE visits v JOIN visit_rollup r ON r.id = 1 "
+                "SET v.rolled_up = TRUE WHERE v.id <= r.last_visit_id",
+                "CREATE INDEX idx_visits_rolled_up ON visits (rolled_up, id)",
+                "DROP TABLE visit_rollup",
+            ],
+            # SQLiteStore updates the counters in the event's own transaction.
+            "sqlite": [
+                "ALTER TABLE visits ADD COLUMN rolled_up INTEGER NOT NULL DEFAULT 1",
+            ],
+        },
+    ),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_VERSIONS_TABLE = {
+    "mysql": """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """,
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """,
+}
+_PARAM = {"mysql": "%s", "sqlite": "?"}
+
+
+@contextmanager
+def _connection(store):
+    """A DB-API connection to `store`'s database, held exclusively."""
+    if store.backend == "sqlite":
+        with store.lock:
+            yield store.conn
+    else:
+        import database
+
+        conn = database.get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def applied_versions(store):
+    with _connection(store) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(_VERSIONS_TABLE[store.backend])
+            cursor.execute("SELECT version FROM schema_migrations")
+            versions = {row[0] for row in cursor.fetchall()}
+            conn.commit()
+        finally:
+            cursor.close()
+    return versions
+
+
+def _already_applied(cursor, version):
+    """Takes SQLite's write lock and checks `version` is still pending.
+
+    The web process and the recognition worker both migrate when they open
+    the file. Whichever gets the lock first applies the migration; the
+    other then finds it recorded. SQLite DDL is transactional, so the
+    migration commits as a whole or not at all.
+    """
+    cursor.execute("BEGIN IMMEDIATE")
+    cursor.execute("SELECT 1 FROM schema_migrations WHERE version = ?", (version,))
+    return cursor.fetchone() is not None
+
+
+def migrate(store, target=None):
+    """Applies the pending migrations up to `target` (default: all).
+
+    Returns the versions applied. A failing statement raises; the versions
+    applied before it stay recorded. (MySQL commits DDL implicitly, so a
+    migration that fails half-way is not rolled back there.)
+    """
+    target = LATEST_VERSION if target is None else target
+    done = applied_versions(store)
+    applied = []
+    param = _PARAM[store.backend]
+    for version, description, statements in MIGRATIONS:
+        if version in done or version > target:
+            continue
+        with _connection(store) as conn:
+            cursor = conn.cursor()
+            try:
+                if store.backend == "sqlite" and _already_applied(cursor, version):
+                    conn.rollback()
+                    continue
+                logger.info(f"Applying migration {version}: {description}.")
+                for statement in statements[store.backend]:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, description, applied_at) "
+                    f"VALUES ({param}, {param}, {param})",
+                    (
+                        version,
+                        description,
+                        datetime.datetime.now().isoformat(" ", "seconds"),
+                    ),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        applied.append(version)
+    if applied and hasattr(store, "invalidate_schema"):
+        store.invalidate_schema()
+    return applied
+
+
+def status(store):
+    """[(version, description, applied)] for every known migration."""
+    done = applied_versions(store)
+    return [
+        (version, description, version in done)
+        for version, description, _ in MIGRATIONS
+    ]
+
+
+def main():
+    from storage import get_store
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="List migrations and whether they ran.")
+    up = commands.add_parser("up", help="Apply pending migrations.")
+    up.add_argument("--to", type=int, help="Stop after this version.")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == "up":
+        applied = migrate(store, args.to)
+        print(f"Applied: {applied}" if applied else "Nothing to apply.")
+    for version, description, applied in status(store):
+        print(f"{version:>4}  {'applied' if applied else 'pending':<8} {description}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s - %(message)s")
+    main()
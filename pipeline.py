@@ -0,0 +1,301 @@
+import queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+DROP_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class FrameJob:
+    """A captured frame and everything the stages derive from it."""
+
+    def __init__(
+        self, frame, captured_at, camera_id=None, roi=None, buffers=None, scale=None
+    ):
+        self.frame = frame
+        self.captured_at = captured_at
+        self.camera_id = camera_id
+        self.roi = roi  # The camera's RegionOfInterest, if it has one
+        self.buffers = buffers  # The camera's FrameBufferPool, if it has one
+        self.scale = scale  # The camera's AdaptiveDetectionScale, if it has one
+        self.rgb_frame = None
+        self.face_locations = []
+        self.encodings = []
+        self.matches = []  # customer unique_id (or None) per encoding
+        self.distances = []  # face distance of each match (or None)
+        self.results = []
+        self.dropped_by = None  # Name of the stage whose full queue dropped it
+
+    def release(self, attr):
+        """Drops the frame held in `attr`, returning its buffer to the pool."""
+        buffer = getattr(self, attr)
+        setattr(self, attr, None)
+        if self.buffers is not None:
+            self.buffers.release(buffer)
+
+    def release_frames(self):
+        """Returns whichever frame buffers the job still holds to the pool."""
+        for attr in ("frame", "rgb_frame"):
+            if getattr(self, attr) is not None:
+                self.release(attr)
+
+
+class Stage:
+    """A pool of worker threads fed by a bounded queue.
+
+    `func(job)` processes one job and returns it to pass downstream, or None
+    to stop it here. When the queue is full, `drop_policy` decides what
+    happens: "block" waits (backpressure on the upstream stage),
+    "drop_oldest" evicts the oldest queued job and "drop_newest" discards
+    the incoming one. Dropped jobs, like failed ones, give back their frame
+    buffers and are passed to `on_done` with `dropped_by` set.
+
+    With `batch_size` > 1, each worker takes up to that many queued jobs at
+    once (never waiting for more) and `func` receives and returns lists.
+    """
+
+    def __init__(
+        self, name, func, workers=1, queue_size=8, drop_policy="block", batch_size=1
+    ):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy for stage {name}: {drop_policy}")
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.drop_policy = drop_policy
+        self.batch_size = max(1, int(batch_size))
+        self.queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.next_stage = None
+        self.on_done = None  # Called with jobs that finish at this stage
+        self.running = False
+        self.threads = []
+        self.stats_lock = threading.Lock()
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    def start(self):
+        self.running = True
+        self.threads = [
+            threading.Thread(
+                target=self._worker, name=f"stage-{self.name}-{i}", daemon=True
+            )
+            for i in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, job):
+        """Enqueues `job` according to the drop policy. Returns False if dropped."""
+        if self.drop_policy == "block":
+            while self.running:
+                try:
+                    self.queue.put(job, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            self._drop(job)  # Stopped while waiting
+            return False
+
+        while True:
+            try:
+                self.queue.put_nowait(job)
+                return True
+            except queue.Full:
+                if self.drop_policy == "drop_newest":
+                    self._drop(job)
+                    return False
+            try:
+                evicted = self.queue.get_nowait()
+                self.queue.task_done()
+                self._drop(evicted)
+            except queue.Empty:
+                pass
+
+    def _drop(self, job):
+        with self.stats_lock:
+            self.dropped += 1
+        job.dropped_by = self.name
+        self._finish(job)
+
+    def _finish(self, job):
+        job.release_frames()  # No-op for jobs that already gave them back
+        if self.on_done is not None:
+            try:
+                self.on_done(job)
+            except Exception as e:
+                logger.error(f"Error completing job in stage {self.name}: {e}")
+
+    def _next_jobs(self):
+        jobs = [self.queue.get(timeout=0.5)]
+        while len(jobs) < self.batch_size:
+            try:
+                jobs.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return jobs
+
+    def _worker(self):
+        while self.running:
+            try:
+                jobs = self._next_jobs()
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            try:
+                if self.batch_size > 1:
+                    outs = self.func(jobs)
+                else:
+                    outs = [self.func(jobs[0])]
+            except Exception as e:
+                outs = [None] * len(jobs)
+                with self.stats_lock:
+                    self.errors += 1
+                logger.error(f"Error in pipeline stage {self.name}: {e}", exc_info=True)
+            finally:
+                for _ in jobs:
+                    self.queue.task_done()
+            with self.stats_lock:
+                self.processed += len(jobs)
+                self.total_time += time.perf_counter() - started
+            for job, out in zip(jobs, outs):
+                self._dispatch(job, out)
+
+    def _dispatch(self, job, out):
+        if out is not None and self.next_stage is not None:
+            self.next_stage.put(out)
+        elif out is None:
+            self._finish(job)
+
+    def drain(self, timeout):
+        """Waits up to `timeout` seconds for queued jobs to be processed."""
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+        return not self.queue.unfinished_tasks
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(timeout=5)
+            if thread.is_alive():
+                logger.warning(f"Pipeline stage {self.name} did not stop cleanly.")
+        self.threads = []
+
+    def get_stats(self):
+        with self.stats_lock:
+            avg_ms = (self.total_time / self.processed * 1000) if self.processed else 0
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "drop_policy": self.drop_policy,
+                "batch_size": self.batch_size,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "avg_ms": round(avg_ms, 2),
+            }
+
+
+class RecognitionPipeline:
+    """detect -> encode -> match -> persist/emit stages around a FaceProcessor.
+
+    Frames are submitted by the capture loops of one or more cameras and
+    share the stage workers. `on_complete(job)` is called for every frame
+    that finishes, whether it stopped early (no faces) or went all the way
+    through persist; `job.results` holds the sightings to report.
+    """
+
+    STAGE_NAMES = ("detect", "encode", "match", "persist")
+
+    def __init__(self, face_processor, stage_config, on_complete=None):
+        self.face_processor = face_processor
+        batched_encode = stage_config.get("encode", {}).get("batch_size", 1) > 1
+        funcs = {
+            "detect": self._detect,
+            "encode": self._encode_batch if batched_encode else self._encode,
+            "match": self._match,
+            "persist": self._persist,
+        }
+        self.stages = [
+            Stage(name, funcs[name], **stage_config.get(name, {}))
+            for name in self.STAGE_NAMES
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+        for stage in self.stages:
+            stage.on_done = on_complete
+        if self.stages[-1].drop_policy != "block":
+            logger.warning(
+                f"Persist stage set to {self.stages[-1].drop_policy}: visits and "
+                "enrollments are lost when its queue is full."
+            )
+
+    def start(self):
+        # Start downstream first so nothing is handed to a stopped stage.
+        for stage in reversed(self.stages):
+            stage.start()
+
+    def submit(
+        self, frame, captured_at, camera_id=None, roi=None, buffers=None, scale=None
+    ):
+        """Feeds a captured frame into the first stage."""
+        job = FrameJob(frame, captured_at, camera_id, roi, buffers, scale)
+        return self.stages[0].put(job)
+
+    def stop(self, drain_timeout=5):
+        """Stops all stages, letting already-queued work finish upstream first."""
+        for stage in self.stages:
+            stage.drain(drain_timeout)
+            stage.stop()
+
+    def get_stats(self):
+        return {stage.name: stage.get_stats() for stage in self.stages}
+
+    # --- Stage functions ---
+    def _detect(self, job):
+        if not self.face_processor.ensure_loaded():
+            return None
+        job.rgb_frame, job.face_locations = self.face_processor.detect(
+            job.frame, job.roi, job.buffers, job.scale
+        )
+        job.release("frame")  # Only the RGB copy is needed from here on
+        if not job.face_locations:
+            job.release("rgb_frame")
+            return None
+        return job
+
+    def _encode(self, job):
+        job.encodings = self.face_processor.encode(job.rgb_frame, job.face_locations)
+        job.release("rgb_frame")
+        return job if job.encodings else None
+
+    def _encode_batch(self, jobs):
+        # One encoder call for the faces of several frames, possibly from
+        # different cameras.
+        items = [(job.rgb_frame, job.face_locations) for job in jobs]
+        for job, encodings in zip(jobs, self.face_processor.encode_batch(items)):
+            job.encodings = encodings
+            job.release("rgb_frame")
+        return [job if job.encodings else None for job in jobs]
+
+    def _match(self, job):
+        matches = [self.face_processor.match_with_distance(e) for e in job.encodings]
+        job.matches = [customer_id for customer_id, _ in matches]
+        job.distances = [distance for _, distance in matches]
+        return job
+
+    def _persist(self, job):
+        for encoding, customer_id, distance in zip(
+            job.encodings, job.matches, job.distances
+        ):
+            result = self.face_processor.record(
+                encoding, customer_id, job.camera_id, distance
+            )
+            if result:
+                job.results.append(result)
+        return None
@@ -0,0 +1,120 @@
+import math
+import threading
+import cv2
+import numpy as np
+import face_recognition
+from config import QUALITY_GATE
+import logging
+
+logger = logging.getLogger(__name__)
+
+BLUR_SAMPLE_SIZE = (112, 112)
+
+
+def estimate_yaw(landmarks):
+    """Rough head yaw in degrees from a face_recognition landmarks dict.
+
+    Uses how far the nose tip sits from the midpoint between the eyes,
+    relative to the eye distance: 0 when frontal, approaching 90 in profile.
+    Works with both the 5-point and 68-point landmark sets.
+    """
+    left_eye = np.mean(landmarks["left_eye"], axis=0)
+    right_eye = np.mean(landmarks["right_eye"], axis=0)
+    nose_tip = np.mean(landmarks["nose_tip"], axis=0)
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance < 1:
+        return 90.0
+    eye_axis = (right_eye - left_eye) / eye_distance
+    offset = np.dot(nose_tip - (left_eye + right_eye) / 2, eye_axis) / eye_distance
+    return math.degrees(math.asin(min(1.0, abs(offset) * 2)))
+
+
+class FaceQualityGate:
+    """Rejects faces that are not worth encoding.
+
+    Checks run cheapest first: box size, brightness and blur on the face crop,
+    then a landmark-based yaw estimate. Rejections are counted per reason.
+    """
+
+    REASONS = ("too_small", "too_dark", "too_bright", "blurry", "profile")
+
+    def __init__(
+        self,
+        enabled=True,
+        min_face_size=60,
+        min_blur_score=60.0,
+        max_yaw=35.0,
+        min_brightness=40.0,
+        max_brightness=220.0,
+    ):
+        self.enabled = enabled
+        self.min_face_size = min_face_size
+        self.min_blur_score = min_blur_score
+        self.max_yaw = max_yaw
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.accepted = 0
+        self.rejected = dict.fromkeys(self.REASONS, 0)
+
+    @classmethod
+    def from_config(cls):
+        return cls(**QUALITY_GATE)
+
+    def check(self, rgb_frame, location):
+        """Returns the rejection reason for the face at `location`, or None."""
+        top, right, bottom, left = location
+        top, left = max(0, top), max(0, left)
+        bottom = min(rgb_frame.shape[0], bottom)
+        right = min(rgb_frame.shape[1], right)
+        if min(bottom - top, right - left) < self.min_face_size:
+            return "too_small"
+
+        gray = cv2.cvtColor(rgb_frame[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+        brightness = float(gray.mean())
+        if brightness < self.min_brightness:
+            return "too_dark"
+        if brightness > self.max_brightness:
+            return "too_bright"
+
+        sample = cv2.resize(gray, BLUR_SAMPLE_SIZE, interpolation=cv2.INTER_AREA)
+        if cv2.Laplacian(sample, cv2.CV_64F).var() < self.min_blur_score:
+            return "blurry"
+
+        landmarks = face_recognition.face_landmarks(
+            rgb_frame, [location], model="small"
+        )
+        if not landmarks or estimate_yaw(landmarks[0]) > self.max_yaw:
+            return "profile"
+        return None
+
+    def filter(self, rgb_frame, face_locations):
+        """Returns the face locations that pass the gate."""
+        if not self.enabled or not face_locations:
+            return face_locations
+        accepted = []
+        rejected = []
+        for location in face_locations:
+            reason = self.check(rgb_frame, location)
+            if reason:
+                rejected.append(reason)
+            else:
+                accepted.append(location)
+        with self.lock:
+            self.checked += len(face_locations)
+            self.accepted += len(accepted)
+            for reason in rejected:
+                self.rejected[reason] += 1
+        if rejected:
+            logger.debug(f"Quality gate rejected faces: {rejected}")
+        return accepted
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "checked": self.checked,
+                "accepted": self.accepted,
+                "rejected": dict(self.rejected),
+            }
@@ -0,0 +1,145 @@
+"""Resource guards for chatbot-generated SQL.
+
+The chatbot runs whatever SQL the LLM writes, and a plain `SELECT * FROM
+customers` would pull every face-encoding blob into the web process and
+then into the summary prompt. Before a query runs, prepare() checks that it
+is a single read-only SELECT (no SELECT ... INTO, no locking reads),
+expands `SELECT * FROM <table>` to the table's non-blob columns and caps
+its LIMIT. collect() then fetches at most `max_rows` rows and `max_bytes`
+of data, drops blob columns the query did not name, and flags what it cut.
+The stores add a statement timeout and, where the database can estimate
+it, reject plans that scan too many rows.
+"""
+
+import re
+from config import CHAT_QUERY_LIMITS
+
+_COMMENT = re.compile(r"/\*.*?\*/|--[^\n]*|#[^\n]*", re.DOTALL)
+_TRAILING_LIMIT = re.compile(
+    r"\bLIMIT\s+(\d+)(?:\s*,\s*(\d+)|\s+OFFSET\s+(\d+))?\s*$", re.IGNORECASE
+)
+_SELECT_STAR = re.compile(
+    r"^(\s*SELECT\s+(?:DISTINCT\s+)?)\*(\s+FROM\s+[`\"]?(\w+)[`\"]?)(?=\s|$)",
+    re.IGNORECASE,
+)
+_INTO = re.compile(r"\bINTO\b", re.IGNORECASE)
+_LOCKING = re.compile(
+    r"\bFOR\s+(?:UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b", re.IGNORECASE
+)
+# Checked on the raw text, string literals included, so quotes or comments
+# that hide a clause from the patterns above cannot slip it through.
+_WRITE_KEYWORD = re.compile(r"\b(?:INSERT|UPDATE|DELETE|LOCK|SHARE)\b", re.IGNORECASE)
+_JOIN = re.compile(r"\bJOIN\b|,", re.IGNORECASE)
+_WHERE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+
+class QueryRejected(ValueError):
+    """The query is not allowed to run; the message is safe to show the user."""
+
+
+class QueryResult(list):
+    """Rows as tuples (a list, like fetchall()) plus what the guards did."""
+
+    def __init__(self, rows=(), columns=(), truncated=None, dropped_columns=()):
+        super().__init__(rows)
+        self.columns = list(columns)
+        self.truncated = truncated  # None, "rows" or "bytes"
+        self.dropped_columns = list(dropped_columns)
+
+
+def prepare(sql_query, columns=None, max_rows=None):
+    """Returns the SQL to run for `sql_query`, or raises QueryRejected.
+
+    `columns` maps table name -> [(column, is_blob)], used to expand
+    `SELECT *` without blob columns. The keyword checks also look inside
+    string literals, so a value such as 'Update' is refused too.
+    """
+    limits = CHAT_QUERY_LIMITS
+    max_rows = limits["max_rows"] if max_rows is None else max_rows
+    sql = sql_query.strip().rstrip(";").strip()
+    if ";" in _COMMENT.sub("", sql):
+        raise QueryRejected("Only a single statement can be run.")
+    first_word = _COMMENT.sub(" ", sql).split(None, 1)[0].upper() if sql else ""
+    if first_word not in ("SELECT", "WITH"):
+        raise QueryRejected("Only SELECT queries can be run.")
+    if _INTO.search(sql):
+        raise QueryRejected("Queries cannot write to files or variables (INTO).")
+    if _LOCKING.search(_COMMENT.sub(" ", sql)):
+        raise QueryRejected("Queries cannot lock rows (FOR UPDATE, FOR SHARE).")
+    if _WRITE_KEYWORD.search(sql):
+        raise QueryRejected("Only read-only SELECT queries can be run.")
+
+    star = _SELECT_STAR.match(sql)
+    from_clause = _WHERE.split(sql[star.end() :], 1)[0] if star else ""
+    if star and columns and not _JOIN.search(from_clause):
+        table_columns = columns.get(star.group(3)) or columns.get(star.group(3).lower())
+        if table_columns and any(is_blob for _, is_blob in table_columns):
+            kept = [f"`{name}`" for name, is_blob in table_columns if not is_blob]
+            sql = star.group(1) + ", ".join(kept) + sql[star.start(2) :]
+
+    # One row past the cap tells collect() that there was more.
+    cap = max_rows + 1
+    limit = _TRAILING_LIMIT.search(sql)
+    if limit is None:
+        # On a new line if the last one has a comment, which would swallow it.
+        separator = "\n" if _COMMENT.search(sql.rsplit("\n", 1)[-1]) else " "
+        sql = f"{sql}{separator}LIMIT {cap}"
+    elif limit.group(2) is not None:  # LIMIT offset, count
+        if int(limit.group(2)) > cap:
+            sql = f"{sql[: limit.start()]}LIMIT {limit.group(1)}, {cap}"
+    elif int(limit.group(1)) > cap:
+        offset = f" OFFSET {limit.group(3)}" if limit.group(3) is not None else ""
+        sql = f"{sql[: limit.start()]}LIMIT {cap}{offset}"
+    return sql
+
+
+def _size(value):
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return 8
+
+
+def collect(cursor, sql, max_rows=None, max_bytes=None):
+    """Fetches the rows of the executed `sql` from `cursor` within the caps.
+
+    Columns holding binary values are dropped unless `sql` names them.
+    Rows past the caps are read and discarded one at a time, so the cursor
+    is left clean without holding them in memory.
+    """
+    limits = CHAT_QUERY_LIMITS
+    max_rows = limits["max_rows"] if max_rows is None else max_rows
+    max_bytes = limits["max_bytes"] if max_bytes is None else max_bytes
+    columns = [d[0] for d in cursor.description or ()]
+    named = {word.lower() for word in re.findall(r"\w+", sql)}
+    dropped = set()  # Indexes of blob columns
+    rows = []
+    size = 0
+    truncated = None
+    while True:
+        row = cursor.fetchone()
+        if row is None:
+            break
+        if truncated:
+            continue  # Drain
+        if len(rows) >= max_rows:
+            truncated = "rows"
+            continue
+        for i, value in enumerate(row):
+            if (
+                isinstance(value, (bytes, bytearray))
+                and columns[i].lower() not in named
+            ):
+                dropped.add(i)
+        row = tuple(None if i in dropped else v for i, v in enumerate(row))
+        size += sum(_size(v) for v in row)
+        if size > max_bytes and rows:
+            truncated = "bytes"
+            continue
+        rows.append(row)
+
+    if dropped:
+        rows = [tuple(v for i, v in enumerate(r) if i not in dropped) for r in rows]
+    kept_columns = [c for i, c in enumerate(columns) if i not in dropped]
+    return QueryResult(
+        rows, kept_columns, truncated, [columns[i] for i in sorted(dropped)]
+    )
@@ -1,8 +1,14 @@
-import cv2
 import threading
 import time
 import datetime
+from collections import deque
 from main import FaceProcessor
+from capture import LatestFrameCapture
+from buffers import FrameBufferPool
+from pipeline import RecognitionPipeline
+from roi import RegionOfInterest
+from detection import AdaptiveDetectionScale
+from config import RECOGNITION_INTERVAL, PIPELINE_CONFIG, CAMERAS
 import logging
 
 logger = logging.getLogger(__name__)
@@ -10,6 +16,8 @@ logger = logging.getLogger(__name__)
 # This will be set by app.py after initialization
 socketio = None  # <-- NO 'from app import socketio' HERE!
 
+FPS_WINDOW = 10  # Seconds of completed frames used for the FPS metric
+
 
 def set_socketio_instance(sio):
     """Sets the global socketio instance."""
@@ -18,132 +26,395 @@ def set_socketio_instance(sio):
     logger.info("SocketIO instance set for RecognitionManager.")
 
 
-class RecognitionManager:
-    def __init__(self):
+def parse_schedule(start_str, end_str):
+    """Returns (start_time, end_time) as datetime.time, or (None, None).
+
+    Raises ValueError if the times are not HH:MM.
+    """
+    if not (start_str and end_str):
+        return None, None
+    return (
+        datetime.datetime.strptime(start_str, "%H:%M").time(),
+        datetime.datetime.strptime(end_str, "%H:%M").time(),
+    )
+
+
+class CameraWorker:
+    """One camera source with its own capture thread, schedule and metrics.
+
+    Frames are fed into the manager's shared pipeline, so every camera is
+    matched against the same FaceProcessor index.
+    """
+
+    def __init__(self, camera_id, source, manager, roi=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.manager = manager
+        self.roi = RegionOfInterest(roi) if roi else None
+        self.buffers = FrameBufferPool(camera_id)
+        self.detection_scale = AdaptiveDetectionScale.from_config(camera_id)
         self.running = False
         self.thread = None
-        self.face_processor = FaceProcessor()
+        self.capture = None
         self.start_time_obj = None  # Use datetime.time objects
         self.end_time_obj = None
         self.lock = threading.Lock()
-        self.last_status_emit = 0
-        self.camera_index = 0  # Default camera index
+        self.frames_submitted = 0
+        self.frames_completed = 0
+        self.frames_dropped = 0  # By a full pipeline queue
+        self.completed_times = deque()
+        self.last_latency_ms = None  # Capture-to-result latency of last frame
+        self.avg_latency_ms = None  # Exponentially weighted average
 
-    def _emit_status(self):
-        """Emits the current status via SocketIO if available."""
-        global socketio
-        if socketio:
-            current_time = time.time()
-            if current_time - self.last_status_emit > 5:  # Emit every 5 secs
-                status = self.get_status()
-                # Use socketio.emit - it handles multiple clients
-                socketio.emit("rec_status_update", status)
-                self.last_status_emit = current_time
-        # else:
-        #     logger.debug("SocketIO not yet set, cannot emit status.")
-
-    def _recognition_loop(self):
-        logger.info(f"Attempting to open camera index {self.camera_index}...")
-        cap = cv2.VideoCapture(self.camera_index)
-        if not cap.isOpened():
-            logger.error(f"Error: Could not open webcam index {self.camera_index}.")
+    def in_schedule(self):
+        if not (self.start_time_obj and self.end_time_obj):
+            return True
+        now = datetime.datetime.now().time()
+        if self.start_time_obj <= self.end_time_obj:
+            return self.start_time_obj <= now <= self.end_time_obj
+        return now >= self.start_time_obj or now <= self.end_time_obj
+
+    def on_complete(self, job):
+        """Called by the pipeline when one of this camera's frames finishes."""
+        if job.dropped_by:
+            # Counted, but kept out of the FPS and latency of processed frames.
+            with self.lock:
+                self.frames_dropped += 1
+            return
+        now = time.time()
+        latency_ms = (now - job.captured_at) * 1000.0
+        with self.lock:
+            self.frames_completed += 1
+            self.completed_times.append(now)
+            self.last_latency_ms = latency_ms
+            if self.avg_latency_ms is None:
+                self.avg_latency_ms = latency_ms
+            else:
+                self.avg_latency_ms = 0.9 * self.avg_latency_ms + 0.1 * latency_ms
+        logger.debug(
+            f"[{self.camera_id}] Capture-to-result latency: {latency_ms:.1f} ms"
+        )
+        if job.results and socketio:
+            logger.debug(f"[{self.camera_id}] Recognition Results: {job.results}")
+            socketio.emit(
+                "new_recognition",
+                {
+                    "camera_id": self.camera_id,
+                    "results": job.results,
+                    "latency_ms": round(latency_ms, 1),
+                },
+            )
+
+    def _loop(self):
+        logger.info(f"[{self.camera_id}] Attempting to open source {self.source}...")
+        capture = LatestFrameCapture(
+            self.source, name=self.camera_id, buffers=self.buffers
+        )
+        if not capture.start():
+            logger.error(f"[{self.camera_id}] Could not open source {self.source}.")
             with self.lock:
                 self.running = False
-            self._emit_status()  # Emit stopped status
+            self.manager.release_pipeline()
+            self.manager.emit_status(force=True)  # Emit stopped status
             return
 
-        logger.info(f"Recognition loop started (Camera {self.camera_index}).")
+        self.capture = capture
+        pipeline = self.manager.acquire_pipeline()
+        logger.info(f"[{self.camera_id}] Recognition loop started.")
 
         while True:
             with self.lock:
                 if not self.running:
                     break
 
-            self._emit_status()
+            self.manager.emit_status()
 
-            now = datetime.datetime.now().time()
-            in_schedule = True  # Assume running unless proven otherwise
-            if self.start_time_obj and self.end_time_obj:
-                if self.start_time_obj <= self.end_time_obj:
-                    if not (self.start_time_obj <= now <= self.end_time_obj):
-                        in_schedule = False
-                else:
-                    if not (now >= self.start_time_obj or now <= self.end_time_obj):
-                        in_schedule = False
-
-            if not in_schedule:
-                logger.debug("Outside scheduled time. Sleeping.")
+            if not self.in_schedule():
+                logger.debug(f"[{self.camera_id}] Outside scheduled time. Sleeping.")
                 time.sleep(30)
                 continue
 
-            ret, frame = cap.read()
-            if not ret:
-                logger.warning("Warning: Could not read frame, skipping.")
-                time.sleep(1)
+            # Always the freshest frame; anything older was dropped by the
+            # capture thread while the previous frame was being processed.
+            frame, captured_at = capture.read(timeout=1.0)
+            if frame is None:
+                if capture.ended:
+                    logger.info(f"[{self.camera_id}] Source finished.")
+                    break
+                logger.warning(f"[{self.camera_id}] No new frame, skipping.")
                 continue
 
-            try:
-                results = self.face_processor.process_frame(frame)
-                if results and socketio:
-                    logger.debug(f"Recognition Results: {results}")
-                    socketio.emit("new_recognition", {"results": results})
-            except Exception as e:
-                logger.error(f"Error processing frame: {e}", exc_info=True)
+            # Detection onwards runs in the pipeline stages; a full detect
+            # queue drops the oldest frame rather than stalling capture.
+            pipeline.submit(
+                frame,
+                captured_at,
+                self.camera_id,
+                self.roi,
+                self.buffers,
+                self.detection_scale,
+            )
+            self.frames_submitted += 1
 
-            time.sleep(1)
+            time.sleep(RECOGNITION_INTERVAL)
 
-        cap.release()
-        logger.info("Recognition loop stopped and camera released.")
-        self._emit_status()
+        capture.stop()
+        self.capture = None
+        with self.lock:
+            self.running = False
+        self.manager.release_pipeline()
+        logger.info(f"[{self.camera_id}] Recognition loop stopped, source released.")
+        self.manager.emit_status(force=True)
 
     def start(self, start_str=None, end_str=None):
         with self.lock:
             if self.running:
-                return {"status": "error", "message": "Recognition already running."}
-
-            self.start_time_obj = None
-            self.end_time_obj = None
-
-            if start_str and end_str:
-                try:
-                    self.start_time_obj = datetime.datetime.strptime(
-                        start_str, "%H:%M"
-                    ).time()
-                    self.end_time_obj = datetime.datetime.strptime(
-                        end_str, "%H:%M"
-                    ).time()
-                    logger.info(
-                        f"Recognition scheduled between {start_str} and {end_str}."
-                    )
-                except ValueError:
-                    return {
-                        "status": "error",
-                        "message": "Invalid time format. Use HH:MM.",
-                    }
+                return {
+                    "status": "error",
+                    "message": f"Recognition already running on {self.camera_id}.",
+                }
+            try:
+                self.start_time_obj, self.end_time_obj = parse_schedule(
+                    start_str, end_str
+                )
+            except ValueError:
+                return {"status": "error", "message": "Invalid time format. Use HH:MM."}
+
+            if self.start_time_obj:
+                logger.info(
+                    f"[{self.camera_id}] Recognition scheduled between "
+                    f"{start_str} and {end_str}."
+                )
             else:
-                logger.info("Recognition starting immediately (continuous).")
+                logger.info(
+                    f"[{self.camera_id}] Recognition starting immediately "
+                    "(continuous)."
+                )
 
             self.running = True
-            self.thread = threading.Thread(target=self._recognition_loop, daemon=True)
+            self.thread = threading.Thread(
+                target=self._loop, name=f"camera-{self.camera_id}", daemon=True
+            )
             self.thread.start()
-            return {"status": "success", "message": "Recognition process initiated."}
+            return {
+                "status": "success",
+                "message": f"Recognition process initiated on {self.camera_id}.",
+            }
 
     def stop(self):
         with self.lock:
             if not self.running:
-                return {"status": "error", "message": "Recognition not running."}
+                return {
+                    "status": "error",
+                    "message": f"Recognition not running on {self.camera_id}.",
+                }
             self.running = False
-            logger.info("Stop signal sent to recognition thread.")
+            logger.info(f"[{self.camera_id}] Stop signal sent to recognition thread.")
 
         if self.thread:
-            self.thread.join(timeout=5)
+            # The last camera to stop also drains the shared pipeline.
+            self.thread.join(timeout=30)
             if self.thread.is_alive():
-                logger.warning("Recognition thread did not stop cleanly.")
+                logger.warning(
+                    f"[{self.camera_id}] Recognition thread did not stop cleanly."
+                )
         self.thread = None
-        return {"status": "success", "message": "Recognition stopped."}
+        return {
+            "status": "success",
+            "message": f"Recognition stopped on {self.camera_id}.",
+        }
 
     def get_status(self):
-        return {"running": self.running, "scheduled": bool(self.start_time_obj)}
+        with self.lock:
+            cutoff = time.time() - FPS_WINDOW
+            while self.completed_times and self.completed_times[0] < cutoff:
+                self.completed_times.popleft()
+            status = {
+                "camera_id": self.camera_id,
+                "source": str(self.source),
+                "running": self.running,
+                "scheduled": bool(self.start_time_obj),
+                "schedule": {
+                    "start": _format_time(self.start_time_obj),
+                    "end": _format_time(self.end_time_obj),
+                },
+                "fps": round(len(self.completed_times) / FPS_WINDOW, 2),
+                "frames_submitted": self.frames_submitted,
+                "frames_completed": self.frames_completed,
+                "frames_dropped": self.frames_dropped,
+                "latency_ms": {
+                    "last": _round_ms(self.last_latency_ms),
+                    "avg": _round_ms(self.avg_latency_ms),
+                },
+            }
+        capture = self.capture
+        if capture:
+            status["capture"] = capture.get_stats()
+        if self.roi:
+            status["roi"] = self.roi.get_stats()
+        buffers = self.buffers.get_stats()
+        # Near zero once every buffer in flight is being recycled.
+        buffers["allocations_per_frame"] = round(
+            buffers["allocations"] / max(1, status["frames_submitted"]), 3
+        )
+        status["buffers"] = buffers
+        status["detection"] = self.detection_scale.get_stats()
+        return status
+
+
+class RecognitionManager:
+    def __init__(self, cameras=None):
+        # Created on first start so importing this module stays cheap; the
+        # encoding process pool re-imports the app's main module in workers.
+        self._face_processor = None
+        self.lock = threading.Lock()
+        self.pipeline = None
+        self.last_status_emit = 0
+        self.cameras = {}
+        for camera in cameras if cameras is not None else CAMERAS:
+            self.add_camera(camera["id"], camera["source"], camera.get("roi"))
+
+    @property
+    def face_processor(self):
+        with self.lock:
+            if self._face_processor is None:
+                self._face_processor = FaceProcessor()
+            return self._face_processor
+
+    def add_camera(self, camera_id, source, roi=None):
+        with self.lock:
+            if camera_id in self.cameras:
+                raise ValueError(f"Camera {camera_id} already exists.")
+            self.cameras[camera_id] = CameraWorker(camera_id, source, self, roi)
+
+    def _on_complete(self, job):
+        worker = self.cameras.get(job.camera_id)
+        if worker:
+            worker.on_complete(job)
+
+    def acquire_pipeline(self):
+        """Returns the shared pipeline, starting it for the first camera."""
+        face_processor = self.face_processor
+        with self.lock:
+            if self.pipeline is None:
+                self.pipeline = RecognitionPipeline(
+                    face_processor, PIPELINE_CONFIG, on_complete=self._on_complete
+                )
+                self.pipeline.start()
+                logger.info("Recognition pipeline started.")
+            return self.pipeline
+
+    def release_pipeline(self):
+        """Stops the shared pipeline once no camera is running."""
+        with self.lock:
+            if self.pipeline is None:
+                return
+            if any(worker.running for worker in self.cameras.values()):
+                return
+            self.pipeline.stop()
+            self.pipeline = None
+            logger.info("Recognition pipeline stopped.")
+
+    def emit_status(self, force=False):
+        """Emits the current status via SocketIO if available."""
+        global socketio
+        if socketio:
+            current_time = time.time()
+            # Emit every 5 secs
+            if force or current_time - self.last_status_emit > 5:
+                status = self.get_status()
+                # Use socketio.emit - it handles multiple clients
+                socketio.emit("rec_status_update", status)
+                self.last_status_emit = current_time
+
+    def _targets(self, camera_id):
+        if camera_id is None:
+            return list(self.cameras.values())
+        worker = self.cameras.get(camera_id)
+        return [worker] if worker else []
+
+    def start(self, start_str=None, end_str=None, camera_id=None):
+        """Starts one camera, or every camera if `camera_id` is None."""
+        targets = self._targets(camera_id)
+        if not targets:
+            return {"status": "error", "message": f"Unknown camera: {camera_id}."}
+        if camera_id is not None:
+            return targets[0].start(start_str, end_str)
+
+        results = {
+            worker.camera_id: worker.start(start_str, end_str) for worker in targets
+        }
+        started = [cid for cid, r in results.items() if r["status"] == "success"]
+        if not started:
+            return {"status": "error", "message": "Recognition already running."}
+        return {
+            "status": "success",
+            "message": f"Recognition process initiated on {', '.join(started)}.",
+            "cameras": results,
+        }
+
+    def stop(self, camera_id=None):
+        """Stops one camera, or every camera if `camera_id` is None."""
+        targets = self._targets(camera_id)
+        if not targets:
+            return {"status": "error", "message": f"Unknown camera: {camera_id}."}
+        if camera_id is not None:
+            return targets[0].stop()
+
+        running = [worker for worker in targets if worker.running]
+        if not running:
+            return {"status": "error", "message": "Recognition not running."}
+        results = {worker.camera_id: worker.stop() for worker in running}
+        return {
+            "status": "success",
+            "message": "Recognition stopped.",
+            "cameras": results,
+        }
+
+    def close(self):
+        """Stops every camera and releases the FaceProcessor's encoder.
+
+        With the process encoding backend this shuts down its worker pool
+        and shared-memory frames now rather than leaving them to atexit.
+        """
+        self.stop()
+        with self.lock:
+            face_processor, self._face_processor = self._face_processor, None
+        if face_processor is not None:
+            face_processor.close()
+
+    def get_status(self, camera_id=None):
+        if camera_id is not None:
+            worker = self.cameras.get(camera_id)
+            return worker.get_status() if worker else None
+
+        cameras = {cid: worker.get_status() for cid, worker in self.cameras.items()}
+        status = {
+            "running": any(c["running"] for c in cameras.values()),
+            "scheduled": any(c["scheduled"] for c in cameras.values()),
+            "cameras": cameras,
+        }
+        pipeline = self.pipeline
+        if pipeline:
+            status["pipeline"] = pipeline.get_stats()
+        if self._face_processor is not None:
+            status["encoder"] = self._face_processor.encoder.get_stats()
+            status["quality_gate"] = self._face_processor.quality_gate.get_stats()
+            status["enrollment"] = self._face_processor.pending.get_stats()
+            store = self._face_processor.store
+            if hasattr(store, "get_visit_queue_stats"):
+                status["visit_queue"] = store.get_visit_queue_stats()
+            if hasattr(store, "get_pool_stats"):
+                status["db_pool"] = store.get_pool_stats()
+        return status
+
+
+def _round_ms(value):
+    return round(value, 1) if value is not None else None
+
+
+def _format_time(value):
+    return value.strftime("%H:%M") if value else None
 
 
 recognition_manager_instance = RecognitionManager()
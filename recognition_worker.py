@@ -0,0 +1,292 @@
+"""Runs the RecognitionManager in a separate native process.
+
+The web server monkey-patches threading for eventlet, so recognition threads
+started there are green threads: every dlib call would block the hub and
+stall all HTTP and Socket.IO traffic while a frame is processed. Instead,
+the web process owns a RecognitionProcess, which launches
+
+    python -m recognition_worker <address>
+
+and talks to it over a local multiprocessing connection (a Unix socket, or
+a named pipe on Windows). Commands go one way, results and the manager's
+Socket.IO events come back and are re-emitted by the web process.
+"""
+
+import itertools
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+import logging
+
+logger = logging.getLogger(__name__)
+
+AUTHKEY_ENV = "RECOGNITION_WORKER_AUTHKEY"
+METHODS = ("start", "stop", "get_status")
+CALL_TIMEOUT = 10  # Seconds to wait for a reply
+STOP_TIMEOUT = 60  # Stopping joins every camera thread, which can take a while
+START_TIMEOUT = 30  # Seconds for a launched worker to connect back
+
+
+# --- Worker process side ---
+class _ConnectionEmitter:
+    """Stands in for socketio in the worker; forwards emits to the web process."""
+
+    def __init__(self, conn, send_lock):
+        self.conn = conn
+        self.send_lock = send_lock
+
+    def emit(self, event, data):
+        try:
+            with self.send_lock:
+                self.conn.send(("emit", event, data))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Could not forward {event} to the web process: {e}")
+
+
+def _handle_call(manager, conn, send_lock, call_id, method, args):
+    try:
+        result = getattr(manager, method)(*args)
+    except Exception as e:
+        logger.error(f"Recognition worker call {method} failed: {e}", exc_info=True)
+        result = {"status": "error", "message": f"Recognition worker error: {e}"}
+    try:
+        with send_lock:
+            conn.send(("result", call_id, result))
+    except (OSError, ValueError):
+        pass  # The web process has gone away
+
+
+def serve(address, authkey):
+    """Worker entry point: serves manager calls until the connection closes."""
+    # Connect before the heavy imports so a failing import shows up in the
+    # web process as a closed connection rather than a hung accept().
+    conn = Client(address, authkey=authkey)
+    from recognition_manager import recognition_manager_instance as manager
+    from recognition_manager import set_socketio_instance
+
+    send_lock = threading.Lock()
+    set_socketio_instance(_ConnectionEmitter(conn, send_lock))
+    logger.info(f"Recognition worker {os.getpid()} connected.")
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == "shutdown":
+            break
+        _, call_id, method, args = message
+        if method not in METHODS:
+            continue
+        # Each call gets its own thread so a slow stop() (joining camera
+        # threads) does not hold up status requests.
+        threading.Thread(
+            target=_handle_call,
+            args=(manager, conn, send_lock, call_id, method, args),
+            daemon=True,
+        ).start()
+
+    logger.info("Recognition worker shutting down.")
+    try:
+        manager.close()
+    finally:
+        conn.close()
+
+
+# --- Web process side ---
+class RecognitionProcess:
+    """Drop-in for RecognitionManager that forwards calls to a worker process.
+
+    The worker is launched on first use and relaunched if it dies. Blocking
+    pipe operations go through `offload` (eventlet's tpool.execute in the
+    web server) so they run on a real OS thread instead of blocking the hub.
+    """
+
+    def __init__(self, socketio=None, offload=None):
+        self.socketio = socketio
+        self.offload = offload or (lambda func, *args: func(*args))
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()
+        self.process = None
+        self.conn = None
+        self.pending = {}
+        self.call_ids = itertools.count()
+        self.restarts = 0
+
+    def _launch(self):
+        authkey = secrets.token_bytes(32)
+        listener = Listener(authkey=authkey)
+        env = dict(os.environ, **{AUTHKEY_ENV: authkey.hex()})
+        process = subprocess.Popen(
+            [sys.executable, "-m", "recognition_worker", str(listener.address)],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+        )
+        accepted = {}
+        done = threading.Event()
+
+        def accept():
+            try:
+                accepted["conn"] = self.offload(listener.accept)
+            except Exception as e:
+                accepted["error"] = e
+            done.set()
+
+        threading.Thread(target=accept, name="recognition-accept", daemon=True).start()
+        try:
+            # accept() has no timeout (and named pipes take no socket
+            # timeout), so watch the child while it runs in a thread.
+            deadline = time.monotonic() + START_TIMEOUT
+            while not done.wait(0.2):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    break
+            if not done.is_set() or "error" in accepted:
+                self._abort_launch(process, listener, authkey, done, accepted)
+        finally:
+            listener.close()
+        logger.info(f"Recognition worker started (pid {process.pid}).")
+        return process, accepted["conn"]
+
+    def _abort_launch(self, process, listener, authkey, done, accepted):
+        """Reaps a worker that did not connect and raises."""
+        returncode = process.poll()
+        if returncode is not None:
+            reason = f"exited with code {returncode} before connecting"
+        elif "error" in accepted:
+            reason = f"failed to connect: {accepted['error']}"
+        else:
+            reason = f"did not connect within {START_TIMEOUT}s"
+        if returncode is None:
+            process.kill()
+        self.offload(process.wait)
+        if not done.is_set():
+            # The child is gone, so nobody else can connect: release the
+            # accept() thread with a connection of our own.
+            def unblock():
+                try:
+                    Client(listener.address, authkey=authkey).close()
+                except (OSError, EOFError):
+                    pass
+
+            threading.Thread(target=unblock, daemon=True).start()
+            done.wait(5)
+        if accepted.get("conn") is not None:
+            accepted["conn"].close()
+        raise RuntimeError(f"Recognition worker {reason}.")
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.conn is not None:
+                return self.conn
+            if self.process is not None:
+                self.restarts += 1
+                logger.warning("Recognition worker is gone, restarting it.")
+            self.process, self.conn = self._launch()
+            threading.Thread(
+                target=self._reader,
+                args=(self.conn,),
+                name="recognition-ipc",
+                daemon=True,
+            ).start()
+            return self.conn
+
+    def _reader(self, conn):
+        while True:
+            try:
+                message = self.offload(conn.recv)
+            except (EOFError, OSError):
+                break
+            if message[0] == "result":
+                waiter = self.pending.pop(message[1], None)
+                if waiter:
+                    waiter["result"] = message[2]
+                    waiter["event"].set()
+            elif message[0] == "emit" and self.socketio:
+                self.socketio.emit(message[1], message[2])
+
+        with self.lock:
+            if self.conn is conn:  # Not a deliberate close()
+                logger.error("Lost connection to the recognition worker.")
+                self.conn = None
+        for call_id in list(self.pending):
+            waiter = self.pending.pop(call_id, None)
+            if waiter:
+                waiter["event"].set()  # Result stays None
+
+    def _call(self, method, *args, timeout=CALL_TIMEOUT):
+        try:
+            conn = self._ensure_started()
+        except Exception as e:
+            logger.error(f"Could not start the recognition worker: {e}")
+            return None
+        call_id = next(self.call_ids)
+        waiter = {"event": threading.Event(), "result": None}
+        self.pending[call_id] = waiter
+        try:
+            with self.send_lock:
+                conn.send(("call", call_id, method, args))
+        except (OSError, ValueError) as e:
+            self.pending.pop(call_id, None)
+            logger.error(f"Could not reach the recognition worker: {e}")
+            return None
+        if not waiter["event"].wait(timeout):
+            self.pending.pop(call_id, None)
+            logger.error(f"Recognition worker did not answer {method} in {timeout}s.")
+        return waiter["result"]
+
+    def start(self, start_str=None, end_str=None, camera_id=None):
+        result = self._call("start", start_str, end_str, camera_id)
+        return result or {"status": "error", "message": "Recognition worker error."}
+
+    def stop(self, camera_id=None):
+        result = self._call("stop", camera_id, timeout=STOP_TIMEOUT)
+        return result or {"status": "error", "message": "Recognition worker error."}
+
+    def get_status(self, camera_id=None, launch=True):
+        """The worker's status; with `launch` False, never starts the worker.
+
+        A worker that has not been launched yet is reported as not running.
+        """
+        if not launch and self.conn is None:
+            status = None
+            error = "Recognition worker not started."
+        else:
+            status = self._call("get_status", camera_id)
+            error = "Recognition worker unavailable."
+        if status is None and camera_id is None:
+            return {
+                "running": False,
+                "scheduled": False,
+                "cameras": {},
+                "error": error,
+            }
+        return status
+
+    def close(self):
+        """Asks the worker to stop its cameras and exit."""
+        with self.lock:
+            conn, process = self.conn, self.process
+            self.conn = None
+        if conn is not None:
+            try:
+                with self.send_lock:
+                    conn.send(("shutdown",))
+            except (OSError, ValueError):
+                pass
+        if process is not None:
+            try:
+                self.offload(process.wait, STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+    serve(sys.argv[1], bytes.fromhex(os.environ[AUTHKEY_ENV]))
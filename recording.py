@@ -0,0 +1,302 @@
+"""Record camera frames with timestamps and replay them as a capture source.
+
+    python recording.py record 0 recordings/counter --seconds 60
+    python recording.py record rtsp://... recordings/door --format raw
+    python recording.py info recordings/counter
+
+A recording is a directory holding `meta.json`, `timestamps.txt` (capture
+time of every frame) and the frames, either MJPG-encoded (`frames.avi`,
+small) or as raw BGR bytes (`frames.raw`, bit-exact and memory-mapped on
+replay).
+
+Use `replay://<directory>` as a camera source (CAMERA_SOURCES or
+CAMERAS_FILE) to feed a recording through LatestFrameCapture with its
+original timing, e.g. `replay://recordings/counter?speed=4&loop=1` for
+four times real-time on repeat, or `speed=0` for as fast as possible.
+"""
+
+import argparse
+import json
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+import cv2
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPLAY_SCHEME = "replay://"
+FORMATS = ("mjpg", "raw")
+_FRAME_FILES = {"mjpg": "frames.avi", "raw": "frames.raw"}
+
+
+class FrameRecorder:
+    """Writes frames and their capture timestamps to a recording directory."""
+
+    def __init__(self, path, fmt="mjpg", source=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown recording format: {fmt}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.fmt = fmt
+        self.source = source
+        self.shape = None
+        self.writer = None
+        self.timestamps = []
+
+    def write(self, frame, captured_at=None):
+        if self.shape is None:
+            self.shape = frame.shape
+            frames_path = os.path.join(self.path, _FRAME_FILES[self.fmt])
+            if self.fmt == "mjpg":
+                # The container frame rate is nominal; replay uses timestamps.
+                height, width = frame.shape[:2]
+                self.writer = cv2.VideoWriter(
+                    frames_path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (width, height)
+                )
+            else:
+                self.writer = open(frames_path, "wb")
+        elif frame.shape != self.shape:
+            raise ValueError(f"Frame shape changed from {self.shape} to {frame.shape}")
+
+        if self.fmt == "mjpg":
+            self.writer.write(frame)
+        else:
+            self.writer.write(np.ascontiguousarray(frame).tobytes())
+        self.timestamps.append(captured_at if captured_at is not None else time.time())
+
+    def close(self):
+        if self.writer is not None:
+            if self.fmt == "mjpg":
+                self.writer.release()
+            else:
+                self.writer.close()
+            self.writer = None
+        with open(os.path.join(self.path, "timestamps.txt"), "w") as f:
+            f.writelines(f"{ts:.6f}\n" for ts in self.timestamps)
+        span = self.timestamps[-1] - self.timestamps[0] if self.timestamps else 0
+        meta = {
+            "format": self.fmt,
+            "source": str(self.source),
+            "frames": len(self.timestamps),
+            "shape": list(self.shape) if self.shape else None,
+            "duration_s": round(span, 3),
+            "fps": round((len(self.timestamps) - 1) / span, 2) if span else None,
+        }
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2)
+        return meta
+
+
+class ReplayCapture:
+    """Plays a recording back through the cv2.VideoCapture interface.
+
+    read() returns frame i once (timestamp[i] - timestamp[0]) / `speed`
+    seconds have passed since the first read, so the consumer sees the
+    original timing (speed 0 disables pacing). With `loop`, playback starts
+    over at the end instead of reporting end of stream.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.meta = None
+        self.timestamps = []
+        self.pos = 0
+        self.started = None
+        self.loop_offset = 0.0
+        self.last_timestamp = None  # Original capture time of the last frame
+        self._video = None
+        self._raw = None
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                self.meta = json.load(f)
+            with open(os.path.join(path, "timestamps.txt")) as f:
+                self.timestamps = [float(line) for line in f if line.strip()]
+            frames_path = os.path.join(path, _FRAME_FILES[self.meta["format"]])
+            if self.meta["format"] == "raw":
+                self._raw = np.memmap(
+                    frames_path,
+                    dtype=np.uint8,
+                    mode="r",
+                    shape=(len(self.timestamps), *self.meta["shape"]),
+                )
+            else:
+                self._video = cv2.VideoCapture(frames_path)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not open recording {path}: {e}")
+            self.meta = None
+
+    @classmethod
+    def from_url(cls, url):
+        """Opens `replay://<path>?speed=<x>&loop=<0|1>`."""
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        return cls(
+            parts.netloc + parts.path,
+            speed=float(query.get("speed", ["1"])[0]),
+            loop=query.get("loop", ["0"])[0].lower() in ("1", "true", "yes"),
+        )
+
+    def isOpened(self):
+        return self.meta is not None and bool(self.timestamps)
+
+    def _wait_for(self, index):
+        if not self.speed:
+            return
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        offset = self.loop_offset + self.timestamps[index] - self.timestamps[0]
+        delay = self.started + offset / self.speed - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def _rewind(self):
+        self.loop_offset += self.timestamps[-1] - self.timestamps[0]
+        if len(self.timestamps) > 1:
+            # Keep the usual gap between the last and the first frame.
+            self.loop_offset += (self.timestamps[-1] - self.timestamps[0]) / (
+                len(self.timestamps) - 1
+            )
+        self.pos = 0
+        if self._video is not None:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def grab(self):
+        if not self.isOpened():
+            return False
+        if self.pos >= len(self.timestamps):
+            if not self.loop:
+                return False
+            self._rewind()
+        self._wait_for(self.pos)
+        if self._video is not None and not self._video.grab():
+            return False
+        self.last_timestamp = self.timestamps[self.pos]
+        self.pos += 1
+        return True
+
+    def retrieve(self, image=None):
+        if self._video is not None:
+            return self._video.retrieve(image)
+        frame = self._raw[self.pos - 1]
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, np.array(frame)
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop):
+        if not self.isOpened():
+            return 0.0
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.meta.get("fps") or 0.0)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.timestamps))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.pos)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.meta["shape"][1])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.meta["shape"][0])
+        return 0.0
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self.isOpened():
+            return False
+        self.pos = max(0, min(int(value), len(self.timestamps)))
+        self.started = None  # Pacing restarts from the new position
+        if self._video is not None:
+            self._video.set(cv2.CAP_PROP_POS_FRAMES, self.pos)
+        return True
+
+    def release(self):
+        if self._video is not None:
+            self._video.release()
+            self._video = None
+        self._raw = None
+        self.meta = None
+
+
+def is_replay(source):
+    return isinstance(source, str) and source.startswith(REPLAY_SCHEME)
+
+
+def open_capture(source):
+    """cv2.VideoCapture for cameras, URLs and files; ReplayCapture for replay://."""
+    if is_replay(source):
+        return ReplayCapture.from_url(source)
+    return cv2.VideoCapture(source)
+
+
+def record(source, path, fmt="mjpg", seconds=None, max_frames=None):
+    """Records `source` until `seconds` or `max_frames` is reached (or Ctrl+C).
+
+    Video files are converted as fast as they decode, with timestamps taken
+    from their frame positions so replay keeps the footage's timing.
+    """
+    cap = open_capture(source)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open capture source {source}.")
+    from_file = isinstance(source, str) and os.path.isfile(source)
+    recorder = FrameRecorder(path, fmt, source)
+    started = time.time()
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if from_file:
+                captured_at = started + cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            else:
+                captured_at = time.time()
+            recorder.write(frame, captured_at)
+            if max_frames and len(recorder.timestamps) >= max_frames:
+                break
+            if seconds and captured_at - started >= seconds:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+    return recorder.close()
+
+
+def main():
+    from config import _parse_camera_source
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    rec = commands.add_parser("record", help="Record a camera to a directory.")
+    rec.add_argument("source", help="Camera index, stream URL or video file.")
+    rec.add_argument("path", help="Recording directory to create.")
+    rec.add_argument("--format", choices=FORMATS, default="mjpg")
+    rec.add_argument("--seconds", type=float, help="Stop after this long.")
+    rec.add_argument("--frames", type=int, help="Stop after this many frames.")
+    info = commands.add_parser("info", help="Show a recording's metadata.")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        meta = record(
+            _parse_camera_source(args.source),
+            args.path,
+            args.format,
+            args.seconds,
+            args.frames,
+        )
+    else:
+        with open(os.path.join(args.path, "meta.json")) as f:
+            meta = json.load(f)
+    print(json.dumps(meta, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ from email.mime.base import MIMEBase
 from email import encoders
 import os
 from datetime import datetime
-from database import execute_query
+from storage import get_store
 from config import SMTP_CONFIG, ADMIN_EMAIL, REPORT_DIR
 import logging
 
@@ -15,13 +15,7 @@ logger = logging.getLogger(__name__)
 
 def get_visit_data(start_date, end_date):
     """Fetches customer visit data within a date range."""
-    query = """
-        SELECT unique_id, name, email, last_visited, visit_count
-        FROM customers
-        WHERE DATE(last_visited) BETWEEN %s AND %s
-        ORDER BY last_visited DESC
-    """
-    return execute_query(query, (start_date, end_date), fetch_all=True)
+    return get_store().get_visit_data(start_date, end_date)
 
 
 def generate_csv_report(start_date, end_date):
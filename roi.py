@@ -0,0 +1,139 @@
+import itertools
+import threading
+import cv2
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_region(region):
+    """Returns the polygon points of a `[x, y, w, h]` rectangle or `[[x, y], ...]`."""
+    if len(region) == 4 and all(isinstance(v, (int, float)) for v in region):
+        x, y, w, h = region
+        return np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], np.int32)
+    points = np.array(region, dtype=np.int32)
+    if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+        raise ValueError(f"Invalid ROI region: {region}")
+    return points
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _merge_boxes(boxes):
+    """Merges overlapping (left, top, right, bottom) boxes into their union."""
+    boxes = list(boxes)
+    merged = True
+    while merged:
+        merged = False
+        for i, j in itertools.combinations(range(len(boxes)), 2):
+            if _overlaps(boxes[i], boxes[j]):
+                a, b = boxes[i], boxes.pop(j)
+                boxes[i] = (
+                    min(a[0], b[0]),
+                    min(a[1], b[1]),
+                    max(a[2], b[2]),
+                    max(a[3], b[3]),
+                )
+                merged = True
+                break
+    return boxes
+
+
+class RegionOfInterest:
+    """Restricts face detection to parts of a camera's view.
+
+    Regions are pixel rectangles `[x, y, w, h]` or polygons `[[x, y], ...]`.
+    The detector only runs on the bounding box of each region (overlapping
+    boxes are merged first, so nothing is scanned twice), and faces whose
+    centre falls outside every region, e.g. in the corner of a polygon's
+    bounding box, are discarded before encoding.
+    """
+
+    def __init__(self, regions):
+        self.polygons = [_parse_region(region) for region in regions]
+        if not self.polygons:
+            raise ValueError("ROI needs at least one region.")
+        self.lock = threading.Lock()
+        self._shape = None
+        self._mask = None
+        self._crops = []
+        self.frames = 0
+        self.pixels_scanned = 0
+        self.pixels_total = 0
+        self.faces_discarded = 0
+
+    def _prepare(self, shape):
+        """Builds the mask and crop boxes for a frame size, once per size."""
+        with self.lock:
+            if self._shape == shape[:2]:
+                return self._mask, self._crops
+            height, width = shape[:2]
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, self.polygons, 255)
+            boxes = []
+            for polygon in self.polygons:
+                x, y, w, h = cv2.boundingRect(polygon)
+                left, top = max(0, x), max(0, y)
+                right, bottom = min(width, x + w), min(height, y + h)
+                if right > left and bottom > top:
+                    boxes.append((left, top, right, bottom))
+            self._shape, self._mask, self._crops = shape[:2], mask, _merge_boxes(boxes)
+            return self._mask, self._crops
+
+    @staticmethod
+    def _inside(mask, location):
+        top, right, bottom, left = location
+        y = min(max((top + bottom) // 2, 0), mask.shape[0] - 1)
+        x = min(max((left + right) // 2, 0), mask.shape[1] - 1)
+        return bool(mask[y, x])
+
+    def detect(self, detect, rgb_frame, buffers=None):
+        """Runs `detect(image)` on each ROI crop of `rgb_frame`.
+
+        Returns face locations (top, right, bottom, left) in frame coordinates.
+        Crops are copied into buffers from `buffers` if given.
+        """
+        mask, crops = self._prepare(rgb_frame.shape)
+        face_locations = []
+        discarded = 0
+        for left, top, right, bottom in crops:
+            # dlib needs a contiguous array; the crop itself is a strided view.
+            view = rgb_frame[top:bottom, left:right]
+            if buffers is not None:
+                crop = buffers.acquire(view.shape, view.dtype)
+                np.copyto(crop, view)
+            else:
+                crop = np.ascontiguousarray(view)
+            try:
+                found = detect(crop)
+            finally:
+                if buffers is not None:
+                    buffers.release(crop)
+            for t, r, b, l in found:
+                location = (t + top, r + left, b + top, l + left)
+                if self._inside(mask, location):
+                    face_locations.append(location)
+                else:
+                    discarded += 1
+
+        with self.lock:
+            self.frames += 1
+            self.pixels_total += mask.size
+            self.pixels_scanned += sum((r - l) * (b - t) for l, t, r, b in crops)
+            self.faces_discarded += discarded
+        return face_locations
+
+    def get_stats(self):
+        with self.lock:
+            scanned = (
+                self.pixels_scanned / self.pixels_total if self.pixels_total else None
+            )
+            return {
+                "regions": len(self.polygons),
+                "frames": self.frames,
+                "scanned_fraction": round(scanned, 3) if scanned is not None else None,
+                "faces_discarded": self.faces_discarded,
+            }
@@ -0,0 +1,536 @@
+"""Storage backends behind the recognition, dashboard, report and chat queries.
+
+get_store() returns the backend selected by DB_BACKEND:
+
+- "mysql": the MySQL server in DB_CONFIG, through database.py (separate
+  write and read connection pools, queued visit events, prepared
+  statements). Dashboard, report and chat queries run on the read pool,
+  so they never hold a connection the recognition writes need;
+- "sqlite": an embedded database file (SQLITE_PATH) in WAL mode, for
+  single-camera edge boxes, tests and benchmarks. No server and no network
+  round trips; the web and recognition processes share the file.
+"""
+
+from abc import ABC, abstractmethod
+import datetime
+import sqlite3
+import threading
+import time
+import database
+import migrations
+import query_guard
+from config import (
+    CHAT_QUERY_LIMITS,
+    DB_BACKEND,
+    SCHEMA_CACHE_CHECK_INTERVAL,
+    SQLITE_PATH,
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaCache:
+    """Keeps a store's schema description between schema changes.
+
+    Loading it costs a round trip per table, and the chatbot needs it for
+    every database question. The description is kept with a schema version
+    (one cheap query); get() checks the version at most every
+    `check_interval` seconds and only reloads when it changed, so questions
+    in between cost no round trips at all. invalidate() forces a reload on
+    the next get(), e.g. after a migration.
+    """
+
+    def __init__(self, load, version, check_interval=SCHEMA_CACHE_CHECK_INTERVAL):
+        self.load = load
+        self.version = version
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.schema = None
+        self.schema_version = None
+        self.next_check = 0.0
+        self.hits = 0
+        self.checks = 0
+        self.loads = 0
+
+    def get(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.schema is not None and now < self.next_check:
+                self.hits += 1
+                return self.schema
+            version = self.version()
+            self.checks += 1
+            self.next_check = now + self.check_interval
+            if self.schema is not None and version is not None:
+                if version == self.schema_version:
+                    return self.schema
+                logger.info("Database schema changed, reloading its description.")
+            schema = self.load()
+            self.loads += 1
+            # Don't hold on to an empty description from a failed load.
+            if schema and version is not None:
+                self.schema, self.schema_version = schema, version
+            else:
+                self.schema, self.schema_version = None, None
+            return schema
+
+    def invalidate(self):
+        with self.lock:
+            self.schema, self.schema_version = None, None
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "cached": self.schema is not None,
+                "hits": self.hits,
+                "version_checks": self.checks,
+                "loads": self.loads,
+            }
+
+
+class CustomerStore(ABC):
+    """The queries the rest of the backend runs against customer data.
+
+    A backend has to implement every abstract method; the schema cache and
+    close() have defaults.
+    """
+
+    sql_dialect = None  # Named in the chatbot's SQL prompt
+    today_expression = None  # SQL for the start of today, for the same prompt
+
+    @abstractmethod
+    def fetch_all_customers_for_rec(self):
+        """[{unique_id, name, email, face_encoding}] of customers with an encoding."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def fetch_encoding_matrix(self, chunk_size=1000):
+        """(unique_ids, float32 matrix) of every stored encoding."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_customer(
+        self,
+        unique_id,
+        name,
+        email,
+        face_encoding,
+        last_visited,
+        visit_count,
+        camera_id=None,
+    ):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_customer_visit(
+        self, unique_id, camera_id=None, distance=None, visited_at=None
+    ):
+        """Records a visit at `visited_at` (default: now)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_total_customers(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_new_today(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_visits_today(self):
+        """Distinct customers seen today (re-sightings count once)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_visit_trend(self, days=10):
+        """[{visit_date, visit_count}] of distinct customers per day, last `days`."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_top_visitors(self, limit=5):
+        """[{visitor_name, visit_count}] of the most frequent customers."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_visit_data(self, start_date, end_date):
+        """Customers last seen between two dates (inclusive), for reports."""
+        raise NotImplementedError
+
+    def fetch_schema(self):
+        """Human-readable table/column listing for the chatbot (cached)."""
+        return self.schema_cache.get()
+
+    def invalidate_schema(self):
+        """Drops the cached schema description, e.g. after a migration."""
+        self.schema_cache.invalidate()
+        self.columns_cache.invalidate()
+
+    @abstractmethod
+    def run_query(self, sql_query):
+        """Runs chatbot SQL and returns the rows as tuples."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MySQLStore(CustomerStore):
+    """The MySQL server configured in DB_CONFIG."""
+
+    backend = "mysql"
+    sql_dialect = "MySQL"
+    today_expression = "CURDATE()"
+
+    def __init__(self):
+        self.schema_cache = SchemaCache(
+            database.fetch_schema, database.fetch_schema_version
+        )
+        self.columns_cache = SchemaCache(
+            database.fetch_table_columns, database.fetch_schema_version
+        )
+
+    def fetch_all_customers_for_rec(self):
+        return database.fetch_all_customers_for_rec()
+
+    def fetch_encoding_matrix(self, chunk_size=1000):
+        return database.fetch_encoding_matrix(chunk_size)
+
+    def insert_customer(
+        self,
+        unique_id,
+        name,
+        email,
+        face_encoding,
+        last_visited,
+        visit_count,
+        camera_id=None,
+    ):
+        return database.insert_customer(
+            unique_id,
+            name,
+            email,
+            face_encoding,
+            last_visited,
+            visit_count,
+            camera_id=camera_id,
+        )
+
+    def update_customer_visit(
+        self, unique_id, camera_id=None, distance=None, visited_at=None
+    ):
+        return database.update_customer_visit(
+            unique_id, camera_id, distance, visited_at
+        )
+
+    def get_visit_queue_stats(self):
+        return database.get_visit_queue_stats()
+
+    def get_pool_stats(self):
+        return database.get_pool_stats()
+
+    def _count(self, query):
+        result = database.execute_query(
+            query, fetch_one=True, prepared=True, pool="read"
+        )
+        return result["total"] if result else 0
+
+    def get_total_customers(self):
+        return self._count("SELECT COUNT(*) as total FROM customers")
+
+    def get_new_today(self):
+        return self._count(
+            "SELECT COUNT(*) as total FROM customers WHERE visit_count = 1 "
+            "AND (last_visited >= CURDATE() OR last_visited IS NULL)"
+        )
+
+    def get_visits_today(self):
+        return self._count(
+            "SELECT COUNT(DISTINCT customer_id) as total FROM visits "
+            "WHERE visited_at >= CURDATE()"
+        )
+
+    def get_visit_trend(self, days=10):
+        query = """
+            SELECT DATE(visited_at) as visit_date,
+                COUNT(DISTINCT customer_id) as visit_count
+            FROM visits
+            WHERE visited_at >= CURDATE() - INTERVAL %s DAY
+            GROUP BY DATE(visited_at)
+            ORDER BY visit_date ASC
+        """
+        return database.execute_query(
+            query, (days,), fetch_all=True, prepared=True, pool="read"
+        )
+
+    def get_top_visitors(self, limit=5):
+        query = """
+            SELECT COALESCE(name, unique_id) as visitor_name, visit_count
+            FROM customers
+            ORDER BY visit_count DESC
+            LIMIT %s
+        """
+        return database.execute_query(
+            query, (limit,), fetch_all=True, prepared=True, pool="read"
+        )
+
+    def get_visit_data(self, start_date, end_date):
+        query = """
+            SELECT unique_id, name, email, last_visited, visit_count
+            FROM customers
+            WHERE last_visited >= %s AND last_visited < %s + INTERVAL 1 DAY
+            ORDER BY last_visited DESC
+        """
+        return database.execute_query(
+            query, (start_date, end_date), fetch_all=True, pool="read"
+        )
+
+    def run_query(self, sql_query):
+        return database.run_query(sql_query, self.columns_cache.get())
+
+    def close(self):
+        database.visit_log.close()
+
+
+def _timestamp(value):
+    """Stores datetimes as ISO text that sorts and compares chronologically."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(" ", "seconds")
+    return value
+
+
+def _to_timestamp(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return datetime.datetime.fromisoformat(value)
+
+
+def _to_date(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    return datetime.date.fromisoformat(value)
+
+
+# Columns declared TIMESTAMP (and `AS "x [date]"` aliases) come back as
+# datetime/date objects, like they do from MySQL.
+sqlite3.register_converter("TIMESTAMP", _to_timestamp)
+sqlite3.register_converter("DATE", _to_date)
+
+
+class SQLiteStore(CustomerStore):
+    """An embedded SQLite database file, in WAL mode.
+
+    WAL lets the web process read while the recognition worker writes, and
+    makes a commit an append to the log instead of a rewrite of the page.
+    Within a process, one connection is shared under `self.lock` (SQLite
+    runs one writer at a time anyway). A visit is written in one local
+    transaction: the `visits` row plus the customer's counters, so there is
+    no write-behind queue or roll-up to wait for. Pending migrations run
+    when the store opens the file.
+    """
+
+    backend = "sqlite"
+    sql_dialect = "SQLite"
+    today_expression = "date('now', 'localtime')"
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            path,
+            timeout=10,  # Wait this long for the other process's write lock
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+        )
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints
+        self.schema_cache = SchemaCache(self._load_schema, self._schema_version)
+        self.columns_cache = SchemaCache(self._load_columns, self._schema_version)
+        migrations.migrate(self)
+        logger.info(f"Using SQLite database {path}.")
+
+    def _fetch(self, query, params=()):
+        with self.lock:
+            cursor = self.conn.execute(query, params)
+            columns = [c[0].split(" [")[0] for c in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _count(self, query, params=()):
+        with self.lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    def fetch_all_customers_for_rec(self):
+        return self._fetch(
+            "SELECT unique_id, name, email, face_encoding FROM customers "
+            "WHERE face_encoding IS NOT NULL"
+        )
+
+    def fetch_encoding_matrix(self, chunk_size=1000):
+        with self.lock:
+            (expected,) = self.conn.execute(database.ENCODING_COUNT).fetchone()
+            cursor = self.conn.execute(database.ENCODING_SCAN)
+            return database.read_encoding_matrix(cursor, expected, chunk_size)
+
+    def insert_customer(
+        self,
+        unique_id,
+        name,
+        email,
+        face_encoding,
+        last_visited,
+        visit_count,
+        camera_id=None,
+    ):
+        last_visited = _timestamp(last_visited)
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO customers "
+                "(unique_id, name, email, face_encoding, last_visited, visit_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (unique_id, name, email, face_encoding, last_visited, visit_count),
+            )
+            if last_visited is not None:
+                self.conn.execute(
+                    "INSERT INTO visits (customer_id, camera_id, visited_at, enrolled) "
+                    "VALUES (?, ?, ?, 1)",
+                    (unique_id, camera_id, last_visited),
+                )
+            return cursor.lastrowid
+
+    def update_customer_visit(
+        self, unique_id, camera_id=None, distance=None, visited_at=None
+    ):
+        now = _timestamp(visited_at or datetime.datetime.now())
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO visits (customer_id, camera_id, visited_at, distance) "
+                "VALUES (?, ?, ?, ?)",
+                (str(unique_id), camera_id, now, distance),
+            )
+            self.conn.execute(
+                "UPDATE customers SET visit_count = visit_count + 1, "
+                "last_visited = MAX(COALESCE(last_visited, ?), ?) WHERE unique_id = ?",
+                (now, now, str(unique_id)),
+            )
+
+    def get_total_customers(self):
+        return self._count("SELECT COUNT(*) FROM customers")
+
+    def get_new_today(self):
+        return self._count(
+            "SELECT COUNT(*) FROM customers WHERE visit_count = 1 "
+            "AND (last_visited >= date('now', 'localtime') OR last_visited IS NULL)"
+        )
+
+    def get_visits_today(self):
+        return self._count(
+            "SELECT COUNT(DISTINCT customer_id) FROM visits "
+            "WHERE visited_at >= date('now', 'localtime')"
+        )
+
+    def get_visit_trend(self, days=10):
+        return self._fetch(
+            """
+            SELECT date(visited_at) AS "visit_date [date]",
+                COUNT(DISTINCT customer_id) AS visit_count
+            FROM visits
+            WHERE visited_at >= date('now', 'localtime', ?)
+            GROUP BY date(visited_at)
+            ORDER BY 1 ASC
+            """,
+            (f"-{int(days)} days",),
+        )
+
+    def get_top_visitors(self, limit=5):
+        return self._fetch(
+            "SELECT COALESCE(name, unique_id) AS visitor_name, visit_count "
+            "FROM customers ORDER BY visit_count DESC LIMIT ?",
+            (limit,),
+        )
+
+    def get_visit_data(self, start_date, end_date):
+        return self._fetch(
+            """
+            SELECT unique_id, name, email, last_visited, visit_count
+            FROM customers
+            WHERE last_visited >= ? AND last_visited < date(?, '+1 day')
+            ORDER BY last_visited DESC
+            """,
+            (str(start_date), str(end_date)),
+        )
+
+    def _schema_version(self):
+        with self.lock:
+            return self.conn.execute("PRAGMA schema_version").fetchone()[0]
+
+    def _load_schema(self):
+        schema_str = ""
+        with self.lock:
+            tables = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            ).fetchall()
+            for (table,) in tables:
+                cols = self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+                schema_str += f"\nTable `{table}`:\n"
+                for col in cols:
+                    schema_str += f"  - {col[1]} ({col[2]})\n"
+        return schema_str
+
+    def _load_columns(self):
+        columns = {}
+        with self.lock:
+            tables = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%'"
+            ).fetchall()
+            for (table,) in tables:
+                cols = self.conn.execute(f'PRAGMA table_info("{table}")').fetchall()
+                columns[table] = [(col[1], col[2].upper() == "BLOB") for col in cols]
+        return columns
+
+    def run_query(self, sql_query):
+        """Runs chatbot SQL within CHAT_QUERY_LIMITS (see database.run_query).
+
+        SQLite has no row estimates without ANALYZE, so there is no plan
+        check; the timeout is enforced with a progress handler instead.
+        """
+        sql = query_guard.prepare(sql_query, self.columns_cache.get())
+        deadline = time.monotonic() + CHAT_QUERY_LIMITS["timeout_ms"] / 1000
+        with self.lock:
+            # Interrupts the statement once it runs past the deadline.
+            self.conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+            try:
+                return query_guard.collect(self.conn.execute(sql), sql)
+            except sqlite3.Error as e:
+                logger.error(f"Error running LLM query: {e}. Query: {sql}")
+                raise  # Handled in utils.py
+            finally:
+                self.conn.set_progress_handler(None, 0)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_store(backend=None):
+    """Returns the store for `backend` ("mysql" or "sqlite")."""
+    backend = backend or DB_BACKEND
+    if backend == "mysql":
+        return MySQLStore()
+    if backend == "sqlite":
+        return SQLiteStore()
+    raise ValueError(f"Unknown database backend: {backend}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store for DB_BACKEND, created on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = create_store()
+        return _store
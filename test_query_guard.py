@@ -0,0 +1,81 @@
+import pytest
+from query_guard import QueryRejected, prepare
+
+COLUMNS = {
+    "customers": [
+        ("id", False),
+        ("unique_id", False),
+        ("name", False),
+        ("face_encoding", True),
+    ],
+    "visits": [("id", False), ("customer_id", False)],
+}
+
+ACCEPTED = [
+    ("SELECT name FROM customers", "SELECT name FROM customers LIMIT 11"),
+    ("select name from customers;", "select name from customers LIMIT 11"),
+    ("SELECT name FROM customers LIMIT 5", "SELECT name FROM customers LIMIT 5"),
+    (
+        "WITH c AS (SELECT name FROM customers) SELECT * FROM c",
+        "WITH c AS (SELECT name FROM customers) SELECT * FROM c LIMIT 11",
+    ),
+    (
+        "SELECT last_updated FROM customers -- newest first",
+        "SELECT last_updated FROM customers -- newest first\nLIMIT 11",
+    ),
+]
+
+REWRITTEN = [
+    (
+        "SELECT * FROM customers WHERE id > 3",
+        "SELECT `id`, `unique_id`, `name` FROM customers WHERE id > 3 LIMIT 11",
+    ),
+    (
+        "SELECT DISTINCT * FROM `customers`",
+        "SELECT DISTINCT `id`, `unique_id`, `name` FROM `customers` LIMIT 11",
+    ),
+    # No blob columns, or more than one table: left as written.
+    ("SELECT * FROM visits", "SELECT * FROM visits LIMIT 11"),
+    (
+        "SELECT * FROM customers JOIN visits ON unique_id = customer_id",
+        "SELECT * FROM customers JOIN visits ON unique_id = customer_id LIMIT 11",
+    ),
+    ("SELECT name FROM customers LIMIT 500", "SELECT name FROM customers LIMIT 11"),
+    (
+        "SELECT name FROM customers LIMIT 20, 500",
+        "SELECT name FROM customers LIMIT 20, 11",
+    ),
+    (
+        "SELECT name FROM customers LIMIT 500 OFFSET 20",
+        "SELECT name FROM customers LIMIT 11 OFFSET 20",
+    ),
+]
+
+REJECTED = [
+    "",
+    "DELETE FROM customers",
+    "SHOW TABLES",
+    "SELECT 1; DROP TABLE customers",
+    "SELECT name FROM customers INTO OUTFILE '/tmp/customers.csv'",
+    "SELECT face_encoding FROM customers LIMIT 1 INTO DUMPFILE '/tmp/x'",
+    "SELECT COUNT(*) INTO @n FROM customers",
+    "SELECT name FROM customers FOR UPDATE",
+    "SELECT name FROM customers FOR UPDATE NOWAIT",
+    "SELECT name FROM customers FOR SHARE",
+    "select name from customers lock in share mode",
+    "SELECT name FROM customers FOR/**/UPDATE",
+    "SELECT name FROM customers /*!80000 FOR UPDATE */",
+    "SELECT '#' FROM customers FOR/**/UPDATE",
+    "WITH c AS (SELECT id FROM customers) DELETE FROM customers",
+]
+
+
+@pytest.mark.parametrize("sql, expected", ACCEPTED + REWRITTEN)
+def test_prepare(sql, expected):
+    assert prepare(sql, COLUMNS, max_rows=10) == expected
+
+
+@pytest.mark.parametrize("sql", REJECTED)
+def test_prepare_rejects(sql):
+    with pytest.raises(QueryRejected):
+        prepare(sql, COLUMNS, max_rows=10)
@@ -6,7 +6,8 @@ import matplotlib.pyplot as plt
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from config import API_KEY, PLOT_DIR
-from database import fetch_schema, run_query
+from storage import get_store
+from query_guard import QueryRejected
 import logging
 
 logger = logging.getLogger(__name__)
@@ -56,8 +57,8 @@ SQL_PROMPT = PromptTemplate.from_template(
     """
     You are an expert SQL assistant. Given the schema: {schema}
     And the user question: {question}
-    Write a VALID MySQL query. Only output the SQL query. Do not add ```sql or explanations.
-    If the question is about 'today', use CURDATE().
+    Write a VALID {dialect} query. Only output the SQL query. Do not add ```sql or explanations.
+    If the question is about 'today', use {today}.
     If asking for 'top' customers, use ORDER BY visit_count DESC.
     """
 )
@@ -108,7 +109,13 @@ def generate_sql(question, schema):
     llm = get_llm()
     if not llm:
         return "SELECT 'API Key Missing';"
-    prompt = SQL_PROMPT.format(question=question, schema=schema)
+    store = get_store()
+    prompt = SQL_PROMPT.format(
+        question=question,
+        schema=schema,
+        dialect=store.sql_dialect,
+        today=store.today_expression,
+    )
     response = llm.invoke(prompt).content
     return clean_sql_output(response)
 
@@ -213,7 +220,8 @@ def handle_question(question):
             prompt = GOODBYE_PROMPT.format(question=question)
             return llm.invoke(prompt).content, None
         elif "database_query" in route:
-            schema = fetch_schema()
+            store = get_store()
+            schema = store.fetch_schema()
             want_visual = any(
                 keyword in question.lower() for keyword in VISUALIZATION_KEYWORDS
             )
@@ -221,10 +229,16 @@ def handle_question(question):
             sql_query = generate_sql(question, schema)
             logger.info(f"[Generated SQL] {sql_query}")
 
-            results = run_query(sql_query)
+            try:
+                results = store.run_query(sql_query)
+            except QueryRejected as e:
+                logger.info(f"[SQL Rejected] {e}")
+                return str(e), None
             logger.info(f"[SQL Results] {results}")
 
             summary = summarize_result(results)
+            if getattr(results, "truncated", None):
+                summary += f" (Based on the first {len(results)} rows only.)"
 
             if want_visual and results:
                 plot_info = get_visualization_advice(question, results)